@@ -1,8 +1,17 @@
+import os
+
 from flask import Flask, abort, render_template
 
+from .db import close_db
+from .services.image import IMAGE_MAX_UPLOAD_BYTES
 from .views import register
 
 app = Flask(__name__, static_folder="../static", template_folder="../templates")
+app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE", "0").lower() in ("1", "true", "yes")
+# 請求本文超過上限時，Werkzeug 在解析表單的階段就回應 413，不會先把整個上傳檔案暫存起來；
+# 額外保留 1 MiB 給表單的其他欄位與 multipart 邊界
+app.config["MAX_CONTENT_LENGTH"] = IMAGE_MAX_UPLOAD_BYTES + 1024 * 1024
+app.teardown_appcontext(close_db)
 register(app)
 
 
@@ -1,16 +1,35 @@
 import os
+import threading
+from contextlib import contextmanager
 
 import pymysql
+from flask import g, has_app_context
+from pymysql.constants import FIELD_TYPE
+from pymysql.converters import conversions, convert_time
 
+from .pool import ConnectionPool, PoolTimeout  # noqa: F401
 
-def get_db():
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+# 在 Flask 請求以外（例如 migrate.py）使用的連線，每個執行緒各自一條
+_local = threading.local()
+
+
+# 查詢結果的型別轉換，讓資料列直接符合模型的欄位型別：
+# TIME 轉成 datetime.time（預設為 timedelta），DECIMAL 轉成 float（預設為 Decimal）
+CONVERSIONS = {
+    **conversions,
+    FIELD_TYPE.TIME: convert_time,
+    FIELD_TYPE.DECIMAL: float,
+    FIELD_TYPE.NEWDECIMAL: float,
+}
+
+
+def connect():
     """
-    取得資料庫連線
+    建立一條新的資料庫連線
     """
-    # global connection
-    # if connection:  # 重複使用已存在的連線
-    #     return connection
-
     connection = pymysql.connect(
         host=os.getenv("DB_HOST", "localhost"),
         user=os.getenv("DB_USER"),
@@ -18,11 +37,95 @@ def get_db():
         database=os.getenv("DB_NAME"),
         charset="utf8mb4",
         cursorclass=pymysql.cursors.DictCursor,
+        conv=CONVERSIONS,
     )
 
     return connection
 
 
+def get_pool() -> ConnectionPool:
+    """
+    取得全域連線池，第一次呼叫時依環境變數建立
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    connect,
+                    size=int(os.getenv("DB_POOL_SIZE", 5)),
+                    max_overflow=int(os.getenv("DB_POOL_MAX_OVERFLOW", 10)),
+                    recycle=float(os.getenv("DB_POOL_RECYCLE", 3600)),
+                    pre_ping=os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no"),
+                    timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+                )
+
+    return _pool
+
+
+def get_db():
+    """
+    取得資料庫連線
+
+    在 Flask 請求中，同一個請求內的所有呼叫共用同一條連線，並在請求結束時由 `close_db` 歸還；
+    在請求以外則每個執行緒共用一條連線。
+    """
+    if has_app_context():
+        if "db" not in g:
+            g.db = get_pool().acquire()
+        return g.db
+
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        connection = _local.connection = get_pool().acquire()
+
+    return connection
+
+
+def close_db(e=None):
+    """
+    將請求使用的連線歸還連線池，註冊於 `app.teardown_appcontext`
+    """
+    db = g.pop("db", None)
+
+    if db is not None:
+        get_pool().release(db)
+
+
+@contextmanager
+def transaction():
+    """
+    工作單元（unit of work）：區塊內的所有寫入屬於同一個交易
+
+    離開區塊時一次 commit，發生例外則整筆 rollback 並重新拋出。
+    巢狀使用時會併入最外層的交易，只有最外層會 commit 或 rollback。
+
+    用法::
+
+        with transaction() as cursor:
+            cursor.execute(...)
+            cursor.executemany(...)
+
+    :return: 資料庫 cursor
+    """
+    db = get_db()
+    depth = getattr(db, "transaction_depth", 0)
+    db.transaction_depth = depth + 1
+
+    try:
+        with db.cursor() as cursor:
+            yield cursor
+        if depth == 0:
+            db.commit()
+    except BaseException:
+        if depth == 0:
+            db.rollback()
+        raise
+    finally:
+        db.transaction_depth = depth
+
+
 def create_tables():
     """
     建立資料表
@@ -0,0 +1,158 @@
+import threading
+import time
+from typing import Callable
+
+import pymysql
+
+__all__ = ["ConnectionPool", "PoolTimeout"]
+
+
+class PoolTimeout(Exception):
+    """
+    連線池已滿，且在等待時間內沒有可用的連線
+    """
+
+
+class ConnectionPool:
+    """
+    PyMySQL 連線池
+
+    - `size`：常駐的閒置連線數量上限
+    - `max_overflow`：超過 `size` 後最多可再額外建立的連線數量，歸還時會直接關閉
+    - `recycle`：閒置超過此秒數的連線在取出時會重新建立（避免被 MySQL `wait_timeout` 斷線）
+    - `pre_ping`：取出連線時先 ping 一次，斷線則自動重連
+    - `timeout`：連線池用盡時等待可用連線的秒數
+    """
+
+    def __init__(
+        self,
+        creator: Callable[[], pymysql.connections.Connection],
+        size: int = 5,
+        max_overflow: int = 10,
+        recycle: float = 3600,
+        pre_ping: bool = True,
+        timeout: float = 30,
+    ):
+        self._creator = creator
+        self._size = size
+        self._max_overflow = max_overflow
+        self._recycle = recycle
+        self._pre_ping = pre_ping
+        self._timeout = timeout
+
+        # 閒置連線：(連線, 最後歸還時間)，從尾端取出（LIFO）讓熱連線優先被重複使用
+        self._idle: list[tuple[pymysql.connections.Connection, float]] = []
+        self._opened = 0  # 目前存活（閒置 + 借出）的連線數量
+
+        # 有連線歸還或被關閉（空出名額）時喚醒等待中的執行緒
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+    @property
+    def opened(self) -> int:
+        return self._opened
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def _connect(self):
+        try:
+            return self._creator()
+        except Exception:
+            with self._available:
+                self._opened -= 1
+                self._available.notify()
+            raise
+
+    def _discard(self, conn):
+        with self._available:
+            self._opened -= 1
+            self._available.notify()
+
+        try:
+            conn.close()
+        except Exception:
+            pass  # 連線可能早已中斷
+
+    def acquire(self):
+        """
+        從連線池取出一條連線
+
+        沒有閒置連線且已達上限時，等待其他人歸還連線或關閉連線空出名額。
+
+        :return: PyMySQL 連線
+        """
+        deadline = time.monotonic() + self._timeout
+
+        with self._available:
+            while True:
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+
+                if self._opened < self._size + self._max_overflow:
+                    # 先佔用名額，在鎖外建立連線
+                    self._opened += 1
+                    conn = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No connection available within {self._timeout} seconds.")
+                self._available.wait(remaining)
+
+        if conn is None:
+            return self._connect()
+
+        if self._recycle >= 0 and time.monotonic() - returned_at > self._recycle:
+            # 閒置太久，換一條新的連線
+            self._discard(conn)
+            return self.acquire()
+
+        if self._pre_ping:
+            try:
+                conn.ping(reconnect=True)
+            except Exception:
+                self._discard(conn)
+                return self.acquire()
+
+        return conn
+
+    def release(self, conn):
+        """
+        歸還連線
+
+        未結束的交易會先 rollback，避免下一個使用者看到舊的快照或半套的寫入。
+
+        :param conn: 由 `acquire()` 取得的連線
+        """
+        try:
+            if conn.open:
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+
+        if not conn.open:
+            self._discard(conn)
+            return
+
+        with self._available:
+            if len(self._idle) < self._size:
+                self._idle.append((conn, time.monotonic()))
+                self._available.notify()
+                return
+
+        # 溢出的連線直接關閉
+        self._discard(conn)
+
+    def close(self):
+        """
+        關閉所有閒置連線
+        """
+        with self._available:
+            idle, self._idle = self._idle, []
+
+        for conn, _ in idle:
+            self._discard(conn)
@@ -1,9 +1,14 @@
 from .utils import Model, WithTimestamps
 
-__all__ = ["Image"]
+__all__ = ["ImageInfo", "Image"]
 
 
-class Image(Model, WithTimestamps):
+class ImageInfo(Model, WithTimestamps):
     id: int
     name: str
+    size: int = 0
+    width: int = 0
+
+
+class Image(ImageInfo):
     data: bytes
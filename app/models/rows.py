@@ -0,0 +1,115 @@
+from dataclasses import dataclass, fields
+from datetime import date, datetime, time
+from functools import cache
+
+from .store import Store
+
+__all__ = ["Row", "EmployeeRow", "IngredientRow", "StoreRow"]
+
+
+class Row:
+    """
+    列表頁面使用的唯讀資料列
+
+    欄位名稱與對應的 pydantic 模型相同，模板可以用同樣的方式存取；
+    但不經過驗證，也沒有 `__dict__` 與 `__pydantic_fields_set__`，
+    大量資料列時每筆佔用的記憶體只有模型的一小部分。
+    資料列的型別由 `app.db.CONVERSIONS` 負責轉換，因此只適用於資料庫的查詢結果。
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_rows(cls, rows: list[dict]) -> list:
+        """
+        由資料庫查詢結果建立資料列
+
+        只取用宣告的欄位，查詢結果中多餘的欄位會被忽略。
+
+        :param rows: 資料列列表
+
+        :return: 資料列物件列表
+        """
+        names = get_field_names(cls)
+        return [cls(*[row.get(name) for name in names]) for row in rows]
+
+    @classmethod
+    def from_model(cls, model):
+        """
+        由已驗證的模型建立資料列
+
+        :param model: pydantic 模型
+
+        :return: 資料列物件
+        """
+        return cls(*[getattr(model, name) for name in get_field_names(cls)])
+
+
+@cache
+def get_field_names(row_type: type) -> tuple[str, ...]:
+    """
+    取得資料列類別的欄位名稱（依建構子參數順序）
+    """
+    return tuple(field.name for field in fields(row_type))
+
+
+@dataclass(slots=True, frozen=True)
+class IngredientRow(Row):
+    id: int
+    name: str
+
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+
+@dataclass(slots=True, frozen=True)
+class StoreRow(Row):
+    id: int
+    name: str
+    phone: str
+
+    latitude: float
+    longitude: float
+
+    state: str
+    city: str
+    address: str
+    zipcode: str
+
+    weekdays: list[int]
+    open_time: time
+    close_time: time
+    timezone: str = "America/Denver"
+
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+    # 推導屬性
+    employees_count: int = 0
+
+    def __post_init__(self):
+        # 資料列不可修改，建立時的正規化只能透過 object.__setattr__
+        # 資料庫以逗號分隔的字串存放，例如 "1,2,3"
+        if isinstance(self.weekdays, str):
+            object.__setattr__(self, "weekdays", [int(day) for day in self.weekdays.split(",") if day])
+        if self.employees_count is None:
+            object.__setattr__(self, "employees_count", 0)
+
+
+@dataclass(slots=True, frozen=True)
+class EmployeeRow(Row):
+    id: int
+    name: str
+    position: str
+    salary: int
+    email: str
+    phone: str
+
+    hire_date: date
+    type_: str
+
+    # 外鍵屬性
+    store: Store | StoreRow | None = None
+
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
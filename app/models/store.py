@@ -1,4 +1,7 @@
 from datetime import time
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from pydantic import field_validator
 
 from .utils import Model, WithTimestamps
 
@@ -20,6 +23,24 @@ class Store(Model, WithTimestamps):
     weekdays: list[int]
     open_time: time
     close_time: time
+    timezone: str = "America/Denver"  # 營業時間所在的 IANA 時區
 
     # 推導屬性
     employees_count: int = 0
+
+    @field_validator("weekdays", mode="before")
+    @classmethod
+    def parse_weekdays(cls, value):
+        # 資料庫以逗號分隔的字串存放，例如 "1,2,3"
+        if isinstance(value, str):
+            return [int(day) for day in value.split(",") if day]
+        return value
+
+    @field_validator("timezone")
+    @classmethod
+    def check_timezone(cls, value):
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown time zone: {value}")
+        return value
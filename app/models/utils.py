@@ -1,11 +1,45 @@
 from datetime import datetime
+from functools import cache
 
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 
 
 class Model(BaseModel):
     id: int = None
 
+    @classmethod
+    def from_row(cls, row: dict):
+        """
+        由資料庫查詢結果建立模型
+
+        :param row: 資料列
+
+        :return: 模型
+        """
+        return cls.model_validate(row)
+
+    @classmethod
+    def from_rows(cls, rows: list[dict]) -> list:
+        """
+        由資料庫查詢結果一次建立多個模型
+
+        以預先編譯的 `TypeAdapter(list[Model])` 在 pydantic-core 中一次驗證整個結果集，
+        省下每一列呼叫 `model_validate` 的 Python 開銷。
+
+        :param rows: 資料列列表
+
+        :return: 模型列表
+        """
+        return get_list_adapter(cls).validate_python(rows)
+
+
+@cache
+def get_list_adapter(model: type[BaseModel]) -> TypeAdapter:
+    """
+    取得模型列表的 TypeAdapter，每個模型只編譯一次
+    """
+    return TypeAdapter(list[model])
+
 
 class WithTimestamps(BaseModel):
     created_at: datetime = None
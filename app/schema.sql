@@ -5,10 +5,21 @@ CREATE TABLE
     `image` (
         `id` INT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
         `name` VARCHAR(255) NOT NULL UNIQUE,
-        `data` LONGBLOB NOT NULL,
+        `data` LONGBLOB NULL, -- NULL when the content lives in a file storage backend
+        `size` INT UNSIGNED NOT NULL DEFAULT 0,
+        `width` INT UNSIGNED NOT NULL DEFAULT 0, -- pixel width, 0 when unknown
         `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
 
+-- Raw upload hash -> encoded image, so duplicate uploads skip decoding
+CREATE TABLE
+    `image_upload` (
+        `upload_key` CHAR(64) PRIMARY KEY, -- SHA-256 of encoder settings + raw bytes
+        `image_id` INT UNSIGNED NOT NULL,
+        `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (`image_id`) REFERENCES `image` (`id`) ON DELETE CASCADE
+    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
 -- ============================
 -- Store Table
 -- ============================
@@ -20,6 +31,7 @@ CREATE TABLE
         -- Coordinate
         `latitude` DECIMAL(10, 7) NOT NULL,
         `longitude` DECIMAL(10, 7) NOT NULL,
+        `location` POINT SRID 0 GENERATED ALWAYS AS (POINT(`longitude`, `latitude`)) STORED NOT NULL, -- (x, y) = (lon, lat)
         -- Address
         `state` VARCHAR(100) NOT NULL,
         `city` VARCHAR(100) NOT NULL,
@@ -29,9 +41,25 @@ CREATE TABLE
         `weekdays` VARCHAR(100) NOT NULL, -- e.g. "1,2,3,4,5,6,7"
         `open_time` TIME NOT NULL,
         `close_time` TIME NOT NULL,
+        `timezone` VARCHAR(64) NOT NULL DEFAULT 'America/Denver', -- IANA name, opening hours are local to it
+        -- Weekly schedule: bit 0 = Monday, close <= open means the store closes after midnight
+        `weekday_mask` TINYINT UNSIGNED GENERATED ALWAYS AS (
+            (
+                ((FIND_IN_SET('1', `weekdays`) > 0) << 0) |
+                ((FIND_IN_SET('2', `weekdays`) > 0) << 1) |
+                ((FIND_IN_SET('3', `weekdays`) > 0) << 2) |
+                ((FIND_IN_SET('4', `weekdays`) > 0) << 3) |
+                ((FIND_IN_SET('5', `weekdays`) > 0) << 4) |
+                ((FIND_IN_SET('6', `weekdays`) > 0) << 5) |
+                ((FIND_IN_SET('7', `weekdays`) > 0) << 6)
+            )
+        ) STORED NOT NULL,
+        `open_minute` SMALLINT UNSIGNED GENERATED ALWAYS AS (HOUR(`open_time`) * 60 + MINUTE(`open_time`)) STORED NOT NULL,
+        `close_minute` SMALLINT UNSIGNED GENERATED ALWAYS AS (HOUR(`close_time`) * 60 + MINUTE(`close_time`)) STORED NOT NULL,
         -- Others
         `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        SPATIAL INDEX (`location`)
     ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
 
 -- ============================
@@ -3,5 +3,6 @@
 from .employee import *  # noqa
 from .image import *  # noqa
 from .ingredient import *  # noqa
+from .menu import *  # noqa
 from .store import *  # noqa
 from .supplier import *  # noqa
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+__all__ = ["VersionedCache", "menu_cache", "ingredient_count_cache", "image_variant_cache", "store_timezone_cache"]
+
+
+class VersionedCache:
+    """
+    帶有 TTL 與版本號的 read-through 快取
+
+    每筆快取都記錄寫入時的版本號，`invalidate()` 會遞增版本號，
+    讓所有舊的快取立即失效；即使沒有寫入，快取也會在 TTL 到期後重新載入。
+
+    快取鍵可能來自使用者輸入（例如搜尋關鍵字），因此最多保存 `max_entries` 筆，
+    超過時淘汰最久未使用的項目；過期的項目在讀取或寫入時移除。
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._version = 0
+        self._entries: OrderedDict[str, tuple[int, float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get(self, key: str):
+        """
+        取得快取值
+
+        :param key: 快取鍵
+
+        :return: 快取值，不存在、過期或版本不符時回傳 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            version, expires_at, value = entry
+            if version != self._version or expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, version: int | None = None):
+        """
+        寫入快取值
+
+        :param key: 快取鍵
+        :param value: 快取值
+        :param version: 載入資料前取得的版本號，載入期間若已失效則不寫入
+        """
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+
+            now = time.monotonic()
+            self._entries[key] = (self._version, now + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            # 由最久未使用的一端移除過期項目，再淘汰超過上限的項目
+            while self._entries:
+                _, expires_at, _ = next(iter(self._entries.values()))
+                if expires_at > now and len(self._entries) <= self.max_entries:
+                    break
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key: str, loader: Callable[[], Any]):
+        """
+        取得快取值，不存在時呼叫 `loader` 載入並寫入快取
+
+        :param key: 快取鍵
+        :param loader: 載入資料的函式，回傳 None 表示載入失敗，不會寫入快取
+
+        :return: 快取值或 `loader` 的回傳值
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        version = self._version
+        value = loader()
+
+        if value is not None:
+            self.set(key, value, version=version)
+
+        return value
+
+    def invalidate(self):
+        """
+        遞增版本號並清除所有快取
+        """
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+
+# 菜單（餐點與套餐）的快取，餐點或套餐有任何寫入時失效
+menu_cache = VersionedCache(ttl=float(os.getenv("MENU_CACHE_TTL", 300)))
+
+# 食材數量（依搜尋關鍵字）的快取，食材有任何新增、修改或刪除時失效
+ingredient_count_cache = VersionedCache(
+    ttl=float(os.getenv("INGREDIENT_COUNT_CACHE_TTL", 300)),
+    max_entries=int(os.getenv("INGREDIENT_COUNT_CACHE_ENTRIES", 1024)),
+)
+
+# 每張圖片的原圖與實際產生的縮圖寬度，圖片有任何新增或刪除時失效
+image_variant_cache = VersionedCache(ttl=float(os.getenv("IMAGE_VARIANT_CACHE_TTL", 3600)))
+
+# 商店使用的時區列表，商店有任何新增、修改或刪除時失效
+store_timezone_cache = VersionedCache(ttl=float(os.getenv("STORE_TIMEZONE_CACHE_TTL", 300)))
@@ -1,7 +1,11 @@
-from app.db import get_db
+from collections import defaultdict
+
+from app.db import get_db, transaction
 from app.models import Combo, Dish
 
-from .dish import get_dish_by_name
+from .cache import menu_cache
+from .dish import get_dish_ids_by_names
+from .identity import get_identity_map
 from .image import process_image_upload
 
 __all__ = [
@@ -13,6 +17,7 @@
     "add_dish_to_combo",
     "remove_dish_from_combo",
     "get_dishes_in_combo",
+    "get_dishes_in_combos",
 ]
 
 
@@ -24,8 +29,6 @@ def add_combo(data: dict):
 
     :return: 新增的套餐資料或 None
     """
-    db = get_db()
-
     after = data.pop("dishes", [])
     data = process_image_upload(data)
 
@@ -33,7 +36,8 @@ def add_combo(data: dict):
     combo = Combo.model_validate(data)
 
     try:
-        with db.cursor() as cursor:
+        # 套餐與所有餐點關聯在同一個交易中寫入
+        with transaction() as cursor:
             cursor.execute(
                 """
                 INSERT INTO combo (name, description, price, image_url)
@@ -41,25 +45,25 @@ def add_combo(data: dict):
                 """,
                 (combo.name, combo.description, combo.price, combo.image_url),
             )
-            db.commit()
             combo_id = cursor.lastrowid
+
+            # 處理餐點關聯
+            update_combo_dishes(cursor, combo_id, before=[], after=after)
     except Exception as e:
         print(f"Error adding combo: {e}")
-        db.rollback()
         return None
 
-    # 處理餐點關聯
-    combo = get_combo_by_id(combo_id)
-    update_combo_dishes(combo, before=[], after=after)
+    menu_cache.invalidate()
 
-    return combo
+    return get_combo_by_id(combo_id)
 
 
-def get_combos(keyword: str = ""):
+def get_combos(keyword: str = "", with_dishes: bool = True):
     """
     取得所有套餐
 
     :param keyword: 搜尋關鍵字
+    :param with_dishes: 是否一併載入套餐中的餐點及總熱量
 
     :return: 套餐列表
     """
@@ -79,7 +83,10 @@ def get_combos(keyword: str = ""):
         print(f"Error getting combos: {e}")
         return []
 
-    combos = [Combo.model_validate(row) for row in rows]
+    combos = Combo.from_rows(rows)
+
+    if with_dishes:
+        get_dishes_in_combos(combos)
 
     return combos
 
@@ -92,6 +99,11 @@ def get_combo_by_id(combo_id: int):
 
     :return: 套餐資料或 None
     """
+    identity = get_identity_map()
+    combo = identity.get(Combo, combo_id)
+    if combo is not None:
+        return combo
+
     db = get_db()
 
     try:
@@ -109,10 +121,10 @@ def get_combo_by_id(combo_id: int):
         print(f"Error getting combo by id: {e}")
         return None
 
-    combo = Combo.model_validate(row)
+    combo = Combo.from_row(row)
     get_dishes_in_combo(combo)
 
-    return combo
+    return identity.add(Combo, combo)
 
 
 def update_combo_by_id(combo_id: int, data: dict):
@@ -124,8 +136,6 @@ def update_combo_by_id(combo_id: int, data: dict):
 
     :return: 更新後的套餐資料或 None
     """
-    db = get_db()
-
     original_combo = get_combo_by_id(combo_id)
     if not original_combo:
         return None
@@ -138,7 +148,8 @@ def update_combo_by_id(combo_id: int, data: dict):
     combo = Combo.model_validate(data)
 
     try:
-        with db.cursor() as cursor:
+        # 套餐與所有餐點關聯在同一個交易中寫入
+        with transaction() as cursor:
             cursor.execute(
                 """
                 UPDATE combo
@@ -153,17 +164,17 @@ def update_combo_by_id(combo_id: int, data: dict):
                     combo_id,
                 ),
             )
-            db.commit()
+
+            # 處理餐點關聯
+            update_combo_dishes(cursor, combo_id, before=before, after=after)
     except Exception as e:
         print(f"Error updating combo by id: {e}")
-        db.rollback()
         return None
 
-    # 處理餐點關聯
-    combo = get_combo_by_id(combo_id)
-    update_combo_dishes(combo, before=before, after=after)
+    get_identity_map().discard(Combo, combo_id)
+    menu_cache.invalidate()
 
-    return combo
+    return get_combo_by_id(combo_id)
 
 
 def delete_combo_by_id(combo_id: int):
@@ -174,23 +185,24 @@ def delete_combo_by_id(combo_id: int):
 
     :return: 是否刪除成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 DELETE FROM combo WHERE id = %s;
                 """,
                 (combo_id,),
             )
-            db.commit()
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
     except Exception as e:
         print(f"Error deleting combo by id: {e}")
-        db.rollback()
         return False
 
+    get_identity_map().discard(Combo, combo_id)
+    menu_cache.invalidate()
+
+    return deleted
+
 
 # ====================
 # Combo Dishes
@@ -206,10 +218,8 @@ def add_dish_to_combo(combo: Combo, dish: Dish):
 
     :return: 是否加入成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 INSERT INTO combo_dish (combo_id, dish_id)
@@ -217,13 +227,15 @@ def add_dish_to_combo(combo: Combo, dish: Dish):
                 """,
                 (combo.id, dish.id),
             )
-            db.commit()
     except Exception as e:
         print(f"Error adding dish to combo: {e}")
-        db.rollback()
         return False
 
+    get_identity_map().discard(Combo, combo.id)
+    menu_cache.invalidate()
+
     combo.dishes.append(dish)
+    combo.total_calories = sum(item.calories for item in combo.dishes)
 
     return True
 
@@ -237,10 +249,8 @@ def remove_dish_from_combo(combo: Combo, dish: Dish):
 
     :return: 是否移除成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 DELETE FROM combo_dish
@@ -248,49 +258,75 @@ def remove_dish_from_combo(combo: Combo, dish: Dish):
                 """,
                 (combo.id, dish.id),
             )
-            db.commit()
             # 沒有刪除任何資料，表示餐點不在套餐中
-            return cursor.rowcount > 0
+            removed = cursor.rowcount > 0
     except Exception as e:
         print(f"Error removing dish from combo: {e}")
-        db.rollback()
         return False
 
-    combo.dishes.remove(dish)
+    get_identity_map().discard(Combo, combo.id)
+    menu_cache.invalidate()
 
-    return True
+    if removed:
+        # 與 `add_dish_to_combo` 一致，同步更新呼叫端持有的套餐
+        combo.dishes[:] = [item for item in combo.dishes if item.id != dish.id]
+        combo.total_calories = sum(item.calories for item in combo.dishes)
 
+    return removed
 
-def update_combo_dishes(combo: Combo, before: list[str], after: list[str]):
+
+def update_combo_dishes(cursor, combo_id: int, before: list[str], after: list[str]):
     """
     更新套餐中的餐點列表
 
-    :param combo: 套餐資料
+    新增與移除的關聯各以單一語句寫入。需在 `transaction()` 中呼叫，
+    發生錯誤時直接拋出例外，由交易整筆 rollback。
+
+    :param cursor: 交易中的 cursor
+    :param combo_id: 套餐 ID
     :param before: 更新前的餐點名稱列表
     :param after: 更新後的餐點名稱列表
-
-    :return: 是否更新成功
     """
     before = set(before)
     after = set(after)
-    to_adds = after - before
-    to_removes = before - after
+    to_adds = []
+    to_removes = []
 
-    # 添加新的餐點
-    for dish_name in to_adds:
-        dish = get_dish_by_name(dish_name)
-        if not dish:
+    # 一次取得所有相關餐點的 ID
+    dish_ids = get_dish_ids_by_names(list(before ^ after))
+
+    for dish_name in after - before:
+        if dish_name not in dish_ids:
             print(f"Dish '{dish_name}' not found. Skipping addition to combo.")
             continue
-        add_dish_to_combo(combo, dish)
+        to_adds.append(dish_ids[dish_name])
 
-    # 移除不需要的餐點
-    for dish_name in to_removes:
-        dish = get_dish_by_name(dish_name)
-        if not dish:
+    for dish_name in before - after:
+        if dish_name not in dish_ids:
             print(f"Dish '{dish_name}' not found. Skipping removal from combo.")
             continue
-        remove_dish_from_combo(combo, dish)
+        to_removes.append(dish_ids[dish_name])
+
+    # 添加新的餐點
+    if to_adds:
+        cursor.executemany(
+            """
+            INSERT INTO combo_dish (combo_id, dish_id)
+            VALUES (%s, %s);
+            """,
+            [(combo_id, dish_id) for dish_id in to_adds],
+        )
+
+    # 移除不需要的餐點
+    if to_removes:
+        placeholders = ", ".join(["%s"] * len(to_removes))
+        cursor.execute(
+            f"""
+            DELETE FROM combo_dish
+            WHERE combo_id = %s AND dish_id IN ({placeholders});
+            """,
+            (combo_id, *to_removes),
+        )
 
 
 def get_dishes_in_combo(combo: Combo):
@@ -301,35 +337,55 @@ def get_dishes_in_combo(combo: Combo):
 
     :return: 套餐資料，包含餐點列表及總熱量
     """
+    get_dishes_in_combos([combo])
+
+    return combo.dishes
+
+
+def get_dishes_in_combos(combos: list[Combo]):
+    """
+    一次載入多個套餐中的餐點，並計算各套餐的總熱量
+
+    所有套餐的餐點以單一 `IN` 查詢取得後在 Python 中分組，總熱量直接由取得的餐點加總。
+    同一道餐點在不同套餐中共用同一個 Dish 物件。
+
+    :param combos: 套餐列表，會直接填入 `dishes` 與 `total_calories`
+
+    :return: 套餐列表
+    """
+    if not combos:
+        return combos
+
     db = get_db()
+    combo_ids = list(dict.fromkeys(combo.id for combo in combos))
+    placeholders = ", ".join(["%s"] * len(combo_ids))
 
     try:
         with db.cursor() as cursor:
             cursor.execute(
-                """
-                SELECT d.* FROM dish d
+                f"""
+                SELECT cd.combo_id, d.* FROM dish d
                 JOIN combo_dish cd ON d.id = cd.dish_id
-                WHERE cd.combo_id = %s;
+                WHERE cd.combo_id IN ({placeholders});
                 """,
-                (combo.id,),
+                combo_ids,
             )
             rows = cursor.fetchall()
-
-            cursor.execute(
-                """
-                SELECT SUM(calories) AS total_calories FROM dish d
-                JOIN combo_dish cd ON d.id = cd.dish_id
-                WHERE cd.combo_id = %s;
-                """,
-                (combo.id,),
-            )
-            total_calries = cursor.fetchone()
     except Exception as e:
-        print(f"Error getting dishes in combo: {e}")
-        return []
+        print(f"Error getting dishes in combos: {e}")
+        return combos
 
-    dishes = [Dish.model_validate(row) for row in rows]
-    combo.dishes = dishes
-    combo.total_calories = total_calries["total_calories"] if total_calries else 0
+    dishes: dict[int, Dish] = {}
+    dishes_by_combo: dict[int, list[Dish]] = defaultdict(list)
 
-    return dishes
+    for row in rows:
+        combo_id = row.pop("combo_id")
+        if row["id"] not in dishes:
+            dishes[row["id"]] = Dish.from_row(row)
+        dishes_by_combo[combo_id].append(dishes[row["id"]])
+
+    for combo in combos:
+        combo.dishes = dishes_by_combo.get(combo.id, [])
+        combo.total_calories = sum(dish.calories for dish in combo.dishes)
+
+    return combos
@@ -1,14 +1,17 @@
-from app.db import get_db
-from app.models import Dish, Ingredient, IngredientInDish
+from app.db import get_db, transaction
+from app.models import Combo, Dish, Ingredient, IngredientInDish
 
+from .cache import menu_cache
+from .identity import get_identity_map
 from .image import process_image_upload
-from .ingredient import add_ingredient, get_ingredient_by_name
+from .ingredient import get_ingredients_by_names
 
 __all__ = [
     "add_dish",
     "get_dishes",
     "get_dish_by_id",
     "get_dish_by_name",
+    "get_dish_ids_by_names",
     "update_dish_by_id",
     "delete_dish_by_id",
     "add_ingredient_to_dish",
@@ -25,22 +28,19 @@ def add_dish(data: dict):
 
     :return: 新增的餐點資料或 None
     """
-    db = get_db()
-
     # 處理需要關聯的食材列表
 
     # 食材名稱 -> 份量 與 單位 的映射
     ingredients_map = {ing["name"]: ing for ing in data.pop("ingredients", [])}
 
-    to_adds = ingredients_map.keys()
-
     data = process_image_upload(data)
 
     # 驗證資料
     dish = Dish.model_validate(data)
 
     try:
-        with db.cursor() as cursor:
+        # 餐點與所有食材關聯在同一個交易中寫入
+        with transaction() as cursor:
             cursor.execute(
                 """
                 INSERT INTO dish (name, description, calories, price, image_url)
@@ -48,23 +48,14 @@ def add_dish(data: dict):
                 """,
                 (dish.name, dish.description, dish.calories, dish.price, dish.image_url),
             )
-            db.commit()
             dish_id = cursor.lastrowid
+
+            save_dish_ingredients(cursor, dish_id, ingredients_map)
     except Exception as e:
         print(f"Error adding dish: {e}")
-        db.rollback()
         return None
 
-    added_dish = get_dish_by_id(dish_id)
-
-    for ing_name in to_adds:
-        ingredient = get_ingredient_by_name(ing_name)
-        if not ingredient:
-            # 自動新增食材
-            ingredient = add_ingredient({"name": ing_name})
-        quantity = ingredients_map[ing_name].get("quantity", 0)
-        unit = ingredients_map[ing_name].get("unit", "mg")
-        add_ingredient_to_dish(added_dish, ingredient, quantity, unit)
+    menu_cache.invalidate()
 
     return get_dish_by_id(dish_id)
 
@@ -92,7 +83,7 @@ def get_dishes(keyword: str = ""):
         print(f"Error getting dishes: {e}")
         return None
 
-    dishes = [Dish.model_validate(row) for row in rows]
+    dishes = Dish.from_rows(rows)
 
     return dishes
 
@@ -105,6 +96,11 @@ def get_dish_by_id(dish_id: int):
 
     :return: 餐點資料或 None
     """
+    identity = get_identity_map()
+    dish = identity.get(Dish, dish_id)
+    if dish is not None:
+        return dish
+
     db = get_db()
 
     try:
@@ -123,10 +119,10 @@ def get_dish_by_id(dish_id: int):
     if not row:
         return None
 
-    dish = Dish.model_validate(row)
+    dish = Dish.from_row(row)
     dish.ingredients = get_ingredients_in_dish(dish)
 
-    return dish
+    return identity.add(Dish, dish)
 
 
 def get_dish_by_name(dish_name: str):
@@ -137,6 +133,11 @@ def get_dish_by_name(dish_name: str):
 
     :return: 餐點資料或 None
     """
+    identity = get_identity_map()
+    dish = identity.get_by_name(Dish, dish_name)
+    if dish is not None:
+        return dish
+
     db = get_db()
 
     try:
@@ -155,10 +156,60 @@ def get_dish_by_name(dish_name: str):
     if not row:
         return None
 
-    dish = Dish.model_validate(row)
+    dish = Dish.from_row(row)
     dish.ingredients = get_ingredients_in_dish(dish)
 
-    return dish
+    return identity.add(Dish, dish)
+
+
+def get_dish_ids_by_names(dish_names: list[str]):
+    """
+    透過多個名稱一次取得餐點 ID
+
+    只查詢 `id` 與 `name` 欄位，不載入食材，適合只需要建立關聯的情境。
+
+    :param dish_names: 餐點名稱列表
+
+    :return: 餐點名稱 -> 餐點 ID 的字典，找不到的名稱不會出現在字典中
+    """
+    identity = get_identity_map()
+    dish_ids: dict[str, int] = {}
+    missing = []
+
+    for name in dict.fromkeys(dish_names):
+        dish = identity.get_by_name(Dish, name)
+        if dish is not None:
+            dish_ids[name] = dish.id
+        else:
+            missing.append(name)
+
+    if not missing:
+        return dish_ids
+
+    db = get_db()
+    placeholders = ", ".join(["%s"] * len(missing))
+
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT id, name FROM dish WHERE name IN ({placeholders});
+                """,
+                missing,
+            )
+            rows = cursor.fetchall()
+    except Exception as e:
+        print(f"Error getting dish ids by names: {e}")
+        return dish_ids
+
+    # 資料庫的比對不分大小寫
+    found = {row["name"].casefold(): row["id"] for row in rows}
+
+    for name in missing:
+        if name.casefold() in found:
+            dish_ids[name] = found[name.casefold()]
+
+    return dish_ids
 
 
 def update_dish_by_id(dish_id: int, data: dict):
@@ -168,27 +219,25 @@ def update_dish_by_id(dish_id: int, data: dict):
     :param dish_id: 餐點 ID
     :param data: 更新後的餐點資料字典
     """
-    db = get_db()
     original_dish = get_dish_by_id(dish_id)
+    if original_dish is None:
+        return None
 
     # 處理需要關聯的食材列表
 
     # 食材名稱 -> 份量 與 單位 的映射
     ingredients_map = {ing["name"]: ing for ing in data.pop("ingredients", [])}
-    ing_names = set(ingredients_map.keys())
-
-    original = set(ing.name for ing in original_dish.ingredients)
 
-    to_adds = ing_names - original  # 新增的食材名稱列表
-    to_removes = original - ing_names  # 移除的食材名稱列表
-    to_updates = ing_names & original  # 更新的食材名稱列表
+    # 移除的食材
+    to_removes = [ing.id for ing in original_dish.ingredients if ing.name not in ingredients_map]
 
     data = process_image_upload(data, original_dish.image_url)
 
     dish = Dish.model_validate(data)
 
     try:
-        with db.cursor() as cursor:
+        # 餐點與所有食材關聯在同一個交易中寫入
+        with transaction() as cursor:
             cursor.execute(
                 """
                 UPDATE dish
@@ -204,34 +253,14 @@ def update_dish_by_id(dish_id: int, data: dict):
                     dish_id,
                 ),
             )
-            db.commit()
+
+            save_dish_ingredients(cursor, dish_id, ingredients_map)
+            delete_dish_ingredients(cursor, dish_id, to_removes)
     except Exception as e:
         print(f"Error updating dish by id: {e}")
-        db.rollback()
         return None
 
-    update_dish = get_dish_by_id(dish_id)
-
-    for ing_name in to_adds:
-        ingredient = get_ingredient_by_name(ing_name)
-        if not ingredient:
-            # 自動新增食材
-            ingredient = add_ingredient({"name": ing_name})
-        quantity = ingredients_map[ing_name].get("quantity", 0)
-        unit = ingredients_map[ing_name].get("unit", "mg")
-        add_ingredient_to_dish(update_dish, ingredient, quantity, unit)
-
-    for ing_name in to_removes:
-        ingredient = get_ingredient_by_name(ing_name)
-        if ingredient:
-            remove_ingredient_from_dish(update_dish, ingredient)
-
-    for ing_name in to_updates:
-        ingredient = get_ingredient_by_name(ing_name)
-        if ingredient:
-            quantity = ingredients_map[ing_name].get("quantity", 0)
-            unit = ingredients_map[ing_name].get("unit", "mg")
-            update_ingredient_in_dish(update_dish, ingredient, quantity, unit)
+    invalidate_dish(dish_id)
 
     return get_dish_by_id(dish_id)
 
@@ -244,23 +273,35 @@ def delete_dish_by_id(dish_id: int):
 
     :return: 是否刪除成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 DELETE FROM dish WHERE id = %s;
                 """,
                 (dish_id,),
             )
-            db.commit()
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
     except Exception as e:
         print(f"Error deleting dish by id: {e}")
-        db.rollback()
         return False
 
+    invalidate_dish(dish_id)
+
+    return deleted
+
+
+def invalidate_dish(dish_id: int):
+    """
+    使餐點及內含該餐點的套餐的請求快取失效，並使菜單快取失效
+
+    :param dish_id: 餐點 ID
+    """
+    identity = get_identity_map()
+    identity.discard(Dish, dish_id)
+    identity.clear(Combo)
+    menu_cache.invalidate()
+
 
 # ====================
 # Dish Ingredients
@@ -278,10 +319,8 @@ def add_ingredient_to_dish(dish: Dish, ingredient: Ingredient, quantity: float,
 
     :return: 是否新增成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 INSERT INTO dish_ingredient (dish_id, ingredient_id, quantity, unit)
@@ -289,12 +328,12 @@ def add_ingredient_to_dish(dish: Dish, ingredient: Ingredient, quantity: float,
                 """,
                 (dish.id, ingredient.id, quantity, unit),
             )
-            db.commit()
     except Exception as e:
         print(f"Error adding ingredient to dish: {e}")
-        db.rollback()
         return False
 
+    get_identity_map().discard(Dish, dish.id)
+
     return True
 
 
@@ -309,10 +348,8 @@ def update_ingredient_in_dish(dish: Dish, ingredient: Ingredient, quantity: floa
 
     :return: 是否更新成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 UPDATE dish_ingredient
@@ -321,12 +358,12 @@ def update_ingredient_in_dish(dish: Dish, ingredient: Ingredient, quantity: floa
                 """,
                 (quantity, unit, dish.id, ingredient.id),
             )
-            db.commit()
     except Exception as e:
         print(f"Error updating ingredient in dish: {e}")
-        db.rollback()
         return False
 
+    get_identity_map().discard(Dish, dish.id)
+
     return True
 
 
@@ -339,10 +376,8 @@ def remove_ingredient_from_dish(dish: Dish, ingredient: Ingredient):
 
     :return: 是否移除成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 DELETE FROM dish_ingredient
@@ -350,14 +385,69 @@ def remove_ingredient_from_dish(dish: Dish, ingredient: Ingredient):
                 """,
                 (dish.id, ingredient.id),
             )
-            db.commit()
-            return cursor.rowcount > 0
+            removed = cursor.rowcount > 0
     except Exception as e:
         print(f"Error removing ingredient from dish: {e}")
-        db.rollback()
         return False
 
-    return True
+    get_identity_map().discard(Dish, dish.id)
+
+    return removed
+
+
+def save_dish_ingredients(cursor, dish_id: int, ingredients_map: dict[str, dict]):
+    """
+    以單一多列 INSERT 寫入餐點的食材關聯，已存在的關聯則更新份量與單位
+
+    需在 `transaction()` 中呼叫，發生錯誤時直接拋出例外，由交易整筆 rollback。
+
+    :param cursor: 交易中的 cursor
+    :param dish_id: 餐點 ID
+    :param ingredients_map: 食材名稱 -> 份量 與 單位 的映射
+    """
+    if not ingredients_map:
+        return
+
+    # 一次取得所有食材，不存在的自動新增
+    ingredients = get_ingredients_by_names(list(ingredients_map))
+
+    rows = [
+        (dish_id, ingredients[ing_name].id, ing.get("quantity", 0), ing.get("unit", "mg"))
+        for ing_name, ing in ingredients_map.items()
+    ]
+
+    cursor.executemany(
+        """
+        INSERT INTO dish_ingredient (dish_id, ingredient_id, quantity, unit)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE quantity = VALUES(quantity), unit = VALUES(unit);
+        """,
+        rows,
+    )
+
+
+def delete_dish_ingredients(cursor, dish_id: int, ingredient_ids: list[int]):
+    """
+    以單一 DELETE 移除餐點的多個食材關聯
+
+    需在 `transaction()` 中呼叫，發生錯誤時直接拋出例外，由交易整筆 rollback。
+
+    :param cursor: 交易中的 cursor
+    :param dish_id: 餐點 ID
+    :param ingredient_ids: 要移除的食材 ID 列表
+    """
+    if not ingredient_ids:
+        return
+
+    placeholders = ", ".join(["%s"] * len(ingredient_ids))
+
+    cursor.execute(
+        f"""
+        DELETE FROM dish_ingredient
+        WHERE dish_id = %s AND ingredient_id IN ({placeholders});
+        """,
+        (dish_id, *ingredient_ids),
+    )
 
 
 def get_ingredients_in_dish(dish: Dish):
@@ -386,6 +476,6 @@ def get_ingredients_in_dish(dish: Dish):
         print(f"Error getting ingredients in dish: {e}")
         return []
 
-    ingredients = [IngredientInDish.model_validate(row) for row in rows]
+    ingredients = IngredientInDish.from_rows(rows)
 
     return ingredients
@@ -1,9 +1,11 @@
 from datetime import datetime
 
-from app.db import get_db
-from app.models import Employee
+from app.db import get_db, transaction
+from app.models import Employee, EmployeeRow, Store
 
-from .store import get_store_by_id
+from .identity import get_identity_map
+from .locator import store_locator
+from .store import get_stores_by_ids
 
 __all__ = [
     "add_employee",
@@ -28,15 +30,13 @@ def add_employee(data: dict):
 
     :return: 新增的員工資料或 None
     """
-    db = get_db()
-
     data["hire_date"] = datetime.strptime(data["hire_date"], "%Y-%m-%d").date()
 
     # 驗證資料
     employee = Employee.model_validate(data)
 
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 INSERT INTO employee (name, position, salary, email, phone, hireDate, type, store)
@@ -53,13 +53,15 @@ def add_employee(data: dict):
                     employee.store.id if employee.store else None,
                 ),
             )
-            db.commit()
             employee_id = cursor.lastrowid
     except Exception as e:
         print(f"Error adding employee: {e}")
-        db.rollback()
         return None
 
+    # 商店的員工數量已改變
+    get_identity_map().clear(Store)
+    store_locator.invalidate()
+
     employee = get_employee_by_id(employee_id)
     return employee
 
@@ -91,16 +93,17 @@ def get_employees():
     """
     取得所有員工資料
 
-    :return: 員工資料列表
+    供列表頁面使用，回傳輕量的唯讀資料列而不是 pydantic 模型
+
+    :return: 員工資料列列表
     """
     db = get_db()
-    employees = []
 
     try:
         with db.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT * FROM employee;
+                SELECT *, hireDate AS hire_date, type AS type_ FROM employee;
                 """
             )
             rows = cursor.fetchall()
@@ -108,13 +111,9 @@ def get_employees():
         print("Error fetching employees:", e)
         return []
 
-    for row in rows:
-        row["store"] = get_store_by_id(row["store"]) if row["store"] else None
-        row["hire_date"] = row["hireDate"]
-        row["type_"] = row["type"]
-        employees.append(Employee.model_validate(row))
+    load_stores(rows)
 
-    return employees
+    return EmployeeRow.from_rows(rows)
 
 
 def get_employee_by_id(employee_id: int):
@@ -125,13 +124,18 @@ def get_employee_by_id(employee_id: int):
 
     :return: Employee 對象或 None
     """
+    identity = get_identity_map()
+    employee = identity.get(Employee, employee_id)
+    if employee is not None:
+        return employee
+
     db = get_db()
 
     try:
         with db.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT * FROM employee WHERE id = %s;
+                SELECT *, hireDate AS hire_date, type AS type_ FROM employee WHERE id = %s;
                 """,
                 (employee_id,),
             )
@@ -143,12 +147,10 @@ def get_employee_by_id(employee_id: int):
     if row is None:
         return None
 
-    row["store"] = get_store_by_id(row["store"]) if row["store"] else None
-    row["hire_date"] = row["hireDate"]
-    row["type_"] = row["type"]
-    employee = Employee.model_validate(row)
+    load_stores([row])
+    employee = Employee.from_row(row)
 
-    return employee
+    return identity.add(Employee, employee)
 
 
 def get_employee_by_email(email: str):
@@ -165,7 +167,7 @@ def get_employee_by_email(email: str):
         with db.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT * FROM employee WHERE email = %s;
+                SELECT *, hireDate AS hire_date, type AS type_ FROM employee WHERE email = %s;
                 """,
                 (email,),
             )
@@ -177,10 +179,8 @@ def get_employee_by_email(email: str):
     if row is None:
         return None
 
-    row["store"] = get_store_by_id(row["store"]) if row["store"] else None
-    row["hire_date"] = row["hireDate"]
-    row["type_"] = row["type"]
-    employee = Employee.model_validate(row)
+    load_stores([row])
+    employee = Employee.from_row(row)
 
     return employee
 
@@ -194,13 +194,11 @@ def update_employee_by_id(employee_id: int, data: dict):
 
     :return: 更新後的員工資料或 None
     """
-    db = get_db()
-
     # 驗證資料
     employee = Employee.model_validate(data)
 
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 UPDATE employee SET name = %s, position = %s, email = %s, phone = %s,
@@ -218,12 +216,15 @@ def update_employee_by_id(employee_id: int, data: dict):
                     employee_id,
                 ),
             )
-            db.commit()
     except Exception as e:
         print(f"Error updating employee: {e}")
-        db.rollback()
         return None
 
+    identity = get_identity_map()
+    identity.discard(Employee, employee_id)
+    identity.clear(Store)
+    store_locator.invalidate()
+
     return get_employee_by_id(employee_id)
 
 
@@ -235,22 +236,23 @@ def delete_employee_by_id(employee_id: int):
 
     :return: 是否刪除成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 DELETE FROM employee WHERE id = %s;
                 """,
                 (employee_id,),
             )
-            db.commit()
     except Exception as e:
         print(f"Error deleting employee: {e}")
-        db.rollback()
         return False
 
+    identity = get_identity_map()
+    identity.discard(Employee, employee_id)
+    identity.clear(Store)
+    store_locator.invalidate()
+
     return True
 
 
@@ -260,22 +262,20 @@ def fire_all_employees_jobless():
 
     :return: 解雇的員工數量
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 DELETE FROM employee WHERE store IS NULL;
                 """
             )
             affected_rows = cursor.rowcount
-            db.commit()
     except Exception as e:
         print(f"Error firing jobless employees: {e}")
-        db.rollback()
         return 0
 
+    get_identity_map().clear(Employee)
+
     return affected_rows
 
 
@@ -353,7 +353,7 @@ def get_employees_by_position(position: str):
         with db.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT * FROM employee WHERE position = %s;
+                SELECT *, hireDate AS hire_date, type AS type_ FROM employee WHERE position = %s;
                 """,
                 (position,),
             )
@@ -362,12 +362,25 @@ def get_employees_by_position(position: str):
         print("Error fetching employees by position:", e)
         return []
 
-    employees = []
-    for row in rows:
-        row["store"] = get_store_by_id(row["store"]) if row["store"] else None
-        row["store"] = get_store_by_id(row["store"]) if row["store"] else None
-        row["hire_date"] = row["hireDate"]
-        row["type_"] = row["type"]
-        employees.append(Employee.model_validate(row))
+    load_stores(rows)
 
-    return employees
+    return Employee.from_rows(rows)
+
+
+# ===================
+# Helpers
+# ===================
+
+
+def load_stores(rows: list[dict]):
+    """
+    批次載入員工資料列所屬的商店，並直接替換 `store` 欄位
+
+    所有不重複的商店 ID 以一次查詢取得，同一間商店的員工共用同一個 Store 物件。
+
+    :param rows: 員工資料列，`store` 欄位為商店 ID 或 None
+    """
+    stores = get_stores_by_ids([row["store"] for row in rows if row["store"]])
+
+    for row in rows:
+        row["store"] = stores.get(row["store"]) if row["store"] else None
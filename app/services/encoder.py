@@ -0,0 +1,265 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.exceptions import ServiceUnavailable
+
+from .utils import convert_to_webp_variants
+
+__all__ = [
+    "ImageEncoder",
+    "ImageEncoderBusy",
+    "encode_image",
+    "encode_image_file",
+    "get_image_encoder",
+]
+
+
+class ImageEncoderBusy(ServiceUnavailable):
+    """
+    編碼佇列已滿，且在等待時間內沒有空位
+
+    繼承 503 Service Unavailable，未被攔截時 Flask 會直接回應 503。
+    """
+
+    description = "Too many images are being processed, please try again later."
+
+
+def encode_image(
+    data: bytes | bytearray,
+    widths: list[int],
+    max_dimension: int | None = None,
+    max_pixels: int | None = None,
+) -> tuple[bytes, dict[int, bytes], int, float]:
+    """
+    在工作行程中解碼並編碼圖片
+
+    必須是模組層級的函式，才能被 pickle 傳給工作行程。
+
+    :param data: 原始圖片的二進位資料
+    :param widths: 縮圖寬度列表
+    :param max_dimension: 原圖最長邊的上限
+    :param max_pixels: 原始圖片的像素數量上限
+
+    :return: (原尺寸的 WebP 資料, 寬度 -> 縮圖 WebP 資料 的字典, 原圖寬度, 編碼耗時秒數)
+    """
+    started = time.perf_counter()
+    webp_data, variants, width = convert_to_webp_variants(data, widths, max_dimension, max_pixels)
+    return webp_data, variants, width, time.perf_counter() - started
+
+
+def encode_image_file(
+    path: str,
+    widths: list[int],
+    max_dimension: int | None = None,
+    max_pixels: int | None = None,
+) -> tuple[bytes, dict[int, bytes], int, float]:
+    """
+    在工作行程中讀取並編碼圖片檔案
+
+    只傳遞路徑給工作行程，原始檔案內容不需要在行程間複製。
+
+    :param path: 圖片檔案路徑
+    :param widths: 縮圖寬度列表
+    :param max_dimension: 原圖最長邊的上限
+    :param max_pixels: 原始圖片的像素數量上限
+
+    :return: (原尺寸的 WebP 資料, 寬度 -> 縮圖 WebP 資料 的字典, 原圖寬度, 讀取與編碼耗時秒數)
+    """
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    webp_data, variants, width = convert_to_webp_variants(data, widths, max_dimension, max_pixels)
+    return webp_data, variants, width, time.perf_counter() - started
+
+
+class ImageEncoder:
+    """
+    在行程池中進行圖片編碼
+
+    Pillow 的解碼與 WebP 編碼是 CPU 密集的工作，放在請求執行緒中會佔住 GIL，
+    拖慢同一個 worker 的其他請求。這裡把工作交給 `ProcessPoolExecutor`，
+    請求執行緒只等待結果。
+
+    - `workers`：工作行程數量
+    - `queue_depth`：同時排隊與執行中的工作數量上限
+    - `queue_timeout`：佇列已滿時等待空位的秒數，逾時拋出 `ImageEncoderBusy`
+    """
+
+    def __init__(self, workers: int, queue_depth: int, queue_timeout: float = 5):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+
+        self._executor: ProcessPoolExecutor | None = None
+        self._slots = threading.BoundedSemaphore(queue_depth)
+        self._lock = threading.Lock()
+
+        # 統計
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_time = 0.0  # 累計等待空位與排隊的秒數
+        self.encode_time = 0.0  # 累計在工作行程中編碼的秒數
+        self.max_wait_time = 0.0
+        self.max_encode_time = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # 使用 spawn 避免在多執行緒的伺服器中 fork 出帶著鎖的子行程；
+                    # 定期替換工作行程，釋放 Pillow 累積的記憶體碎片
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        max_tasks_per_child=100,
+                    )
+
+        return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        """
+        丟棄已損壞的行程池，下一次取得時重新建立
+
+        其他執行緒可能已經換上新的行程池，只有仍是同一個時才替換。
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(
+        self,
+        data: bytes | bytearray,
+        widths: list[int],
+        max_dimension: int | None,
+        max_pixels: int | None,
+    ) -> tuple[bytes, dict[int, bytes], int, float]:
+        """
+        交給行程池編碼並等待結果
+
+        工作行程崩潰或被 OOM killer 終止時，整個行程池會進入 `BrokenProcessPool` 狀態，
+        之後的工作都會失敗；此時換一個新的行程池重試一次。
+        """
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                return executor.submit(encode_image, data, widths, max_dimension, max_pixels).result()
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                if attempt:
+                    raise
+
+    def encode(
+        self,
+        data: bytes | bytearray,
+        widths: list[int],
+        max_dimension: int | None = None,
+        max_pixels: int | None = None,
+    ) -> tuple[bytes, dict[int, bytes], int]:
+        """
+        編碼圖片並產生縮圖，阻塞直到完成
+
+        :param data: 原始圖片的二進位資料
+        :param widths: 縮圖寬度列表
+        :param max_dimension: 原圖最長邊的上限
+        :param max_pixels: 原始圖片的像素數量上限
+
+        :return: (原尺寸的 WebP 資料, 寬度 -> 縮圖 WebP 資料 的字典, 原圖寬度)
+        """
+        submitted = time.perf_counter()
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise ImageEncoderBusy()
+
+        with self._lock:
+            self.pending += 1
+
+        try:
+            webp_data, variants, width, encode_time = self._submit(data, widths, max_dimension, max_pixels)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+
+        # 總耗時扣掉編碼時間，即為等待空位、排隊與傳輸資料的時間
+        wait_time = time.perf_counter() - submitted - encode_time
+
+        with self._lock:
+            self.completed += 1
+            self.wait_time += wait_time
+            self.encode_time += encode_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+            self.max_encode_time = max(self.max_encode_time, encode_time)
+
+        return webp_data, variants, width
+
+    def shutdown(self):
+        """
+        關閉行程池
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        """
+        取得編碼統計
+
+        :return: 包含工作數量、排隊中數量、拒絕次數與耗時的字典
+        """
+        with self._lock:
+            completed = self.completed
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "pending": self.pending,
+                "completed": completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_time": self.wait_time / completed if completed else 0.0,
+                "avg_encode_time": self.encode_time / completed if completed else 0.0,
+                "max_wait_time": self.max_wait_time,
+                "max_encode_time": self.max_encode_time,
+            }
+
+
+_encoder: ImageEncoder | None = None
+_encoder_lock = threading.Lock()
+
+
+def get_image_encoder() -> ImageEncoder:
+    """
+    取得全域的圖片編碼器
+
+    `IMAGE_WORKERS` 設定工作行程數量（預設為 CPU 核心數）；
+    `IMAGE_QUEUE_DEPTH` 設定同時排隊的工作上限（預設為工作行程數量的兩倍）；
+    `IMAGE_QUEUE_TIMEOUT` 設定佇列已滿時等待的秒數。
+    """
+    global _encoder
+
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                workers = int(os.getenv("IMAGE_WORKERS", os.cpu_count() or 1))
+                _encoder = ImageEncoder(
+                    workers=workers,
+                    queue_depth=int(os.getenv("IMAGE_QUEUE_DEPTH", workers * 2)),
+                    queue_timeout=float(os.getenv("IMAGE_QUEUE_TIMEOUT", 5)),
+                )
+
+    return _encoder
@@ -0,0 +1,98 @@
+from flask import g, has_app_context
+from pydantic import BaseModel
+
+__all__ = ["IdentityMap", "get_identity_map"]
+
+
+class IdentityMap:
+    """
+    請求範圍內的實體快取（identity map）
+
+    以 (模型, ID) 及 (模型, 名稱) 為鍵，同一個請求內重複查詢同一筆資料時直接回傳同一個物件，
+    省下資料庫往返與 pydantic 驗證。寫入函式必須呼叫 `discard` / `clear` 使快取失效。
+    """
+
+    def __init__(self):
+        self._by_id: dict[tuple[type, int], BaseModel] = {}
+        self._by_name: dict[tuple[type, str], BaseModel] = {}
+
+    def get(self, model: type, id: int):
+        """
+        以 ID 取得快取中的實體
+
+        :param model: 模型類別
+        :param id: 實體 ID
+
+        :return: 實體或 None
+        """
+        return self._by_id.get((model, id))
+
+    def get_by_name(self, model: type, name: str):
+        """
+        以唯一名稱取得快取中的實體
+
+        :param model: 模型類別
+        :param name: 實體名稱
+
+        :return: 實體或 None
+        """
+        return self._by_name.get((model, name))
+
+    def add(self, model: type, obj: BaseModel):
+        """
+        將實體放入快取
+
+        :param model: 模型類別
+        :param obj: 實體
+
+        :return: 傳入的實體
+        """
+        if obj is None:
+            return None
+
+        self._by_id[(model, obj.id)] = obj
+        if isinstance(getattr(obj, "name", None), str):
+            self._by_name[(model, obj.name)] = obj
+
+        return obj
+
+    def discard(self, model: type, id: int):
+        """
+        移除指定實體的快取
+
+        :param model: 模型類別
+        :param id: 實體 ID
+        """
+        obj = self._by_id.pop((model, id), None)
+
+        if obj is not None and isinstance(getattr(obj, "name", None), str):
+            self._by_name.pop((model, obj.name), None)
+
+    def clear(self, model: type | None = None):
+        """
+        清除某個模型的所有快取，未指定模型時清除全部
+
+        :param model: 模型類別
+        """
+        if model is None:
+            self._by_id.clear()
+            self._by_name.clear()
+            return
+
+        self._by_id = {key: obj for key, obj in self._by_id.items() if key[0] is not model}
+        self._by_name = {key: obj for key, obj in self._by_name.items() if key[0] is not model}
+
+
+def get_identity_map() -> IdentityMap:
+    """
+    取得目前請求的 identity map
+
+    在 Flask 請求以外（例如 migrate.py）每次都回傳一個新的空 map，等同於不快取。
+    """
+    if not has_app_context():
+        return IdentityMap()
+
+    if "identity_map" not in g:
+        g.identity_map = IdentityMap()
+
+    return g.identity_map
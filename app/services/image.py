@@ -1,52 +1,305 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
 
-from app.db import get_db
-from app.models import Image
+from app.db import get_db, transaction
+from app.models import Image, ImageInfo
 
-from .utils import convert_to_webp, get_uuid_from_data
+from .cache import image_variant_cache
+from .encoder import encode_image_file, get_image_encoder
+from .identity import get_identity_map
+from .storage import get_image_storage
+from .utils import ImageTooLarge, get_upload_key, get_uuid_from_data, get_variant_name, new_upload_hasher
 
 __all__ = [
     "add_image",
+    "get_image_by_upload_key",
     "get_image_by_id",
     "get_image_by_name",
+    "get_image_info_by_name",
+    "get_image_path",
+    "get_image_variant_name",
+    "get_image_variant_widths",
+    "get_image_width",
+    "get_image_encoder_stats",
+    "move_images_to_storage",
+    "import_images",
     "delete_image_by_id",
+    "ImageCache",
+    "image_cache",
 ]
 
 
-def add_image(data: bytes) -> Image | None:
+class ImageCache:
+    """
+    以位元組總量為上限的圖片 LRU 快取
+
+    以圖片名稱為鍵保存 Image 物件，取出時直接回傳同一個物件，不會複製圖片內容。
+    圖片內容不會改變（名稱由內容雜湊而來），因此只有刪除時需要失效。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._images: OrderedDict[str, Image] = OrderedDict()
+        self._names: dict[int, str] = {}  # 圖片 ID -> 圖片名稱
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Image | None:
+        """
+        取得快取中的圖片
+
+        :param name: 圖片名稱
+
+        :return: 圖片資料或 None
+        """
+        with self._lock:
+            image = self._images.get(name)
+            if image is None:
+                self.misses += 1
+                return None
+
+            self._images.move_to_end(name)
+            self.hits += 1
+            return image
+
+    def peek(self, name: str) -> Image | None:
+        """
+        取得快取中的圖片，但不計入命中統計，也不更新使用順序
+
+        供只需要描述資料的查詢使用，同一個請求稍後讀取圖片內容時才計算一次命中或未命中。
+
+        :param name: 圖片名稱
+
+        :return: 圖片資料或 None
+        """
+        return self._images.get(name)
+
+    def get_by_id(self, image_id: int) -> Image | None:
+        """
+        以 ID 取得快取中的圖片
+
+        :param image_id: 圖片 ID
+
+        :return: 圖片資料或 None
+        """
+        name = self._names.get(image_id)
+        return self.get(name) if name is not None else None
+
+    def put(self, image: Image):
+        """
+        放入圖片，超過容量時淘汰最久未使用的圖片
+
+        :param image: 圖片資料
+        """
+        size = len(image.data)
+        if size > self.max_bytes:
+            return  # 單張圖片就超過上限，不快取
+
+        with self._lock:
+            old = self._images.pop(image.name, None)
+            if old is not None:
+                self.size -= len(old.data)
+
+            self._images[image.name] = image
+            self._names[image.id] = image.name
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._names.pop(evicted.id, None)
+                self.size -= len(evicted.data)
+                self.evictions += 1
+
+    def discard(self, image_id: int):
+        """
+        移除指定 ID 的圖片
+
+        :param image_id: 圖片 ID
+        """
+        with self._lock:
+            name = self._names.pop(image_id, None)
+            image = self._images.pop(name, None) if name is not None else None
+            if image is not None:
+                self.size -= len(image.data)
+
+    def clear(self):
+        """
+        清除所有快取
+        """
+        with self._lock:
+            self._images.clear()
+            self._names.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """
+        取得快取統計
+
+        :return: 包含數量、大小、命中、未命中與淘汰次數的字典
+        """
+        return {
+            "count": len(self._images),
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# 全域圖片快取，預設 64 MiB
+image_cache = ImageCache(max_bytes=int(os.getenv("IMAGE_CACHE_BYTES", 64 * 1024 * 1024)))
+
+# 上傳時預先產生的縮圖寬度
+IMAGE_VARIANT_WIDTHS = sorted(
+    {int(width) for width in os.getenv("IMAGE_VARIANT_WIDTHS", "200,400,800").split(",") if width.strip()}
+)
+
+# 上傳圖片的位元組上限、解碼前的像素上限，以及儲存原圖的最長邊
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 64_000_000))
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", 2048))
+
+# 讀取上傳串流的區塊大小
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# 批次匯入時視為圖片的副檔名
+IMPORT_IMAGE_EXTENSIONS = (".avif", ".bmp", ".gif", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp")
+
+# 影響編碼結果的設定，任何一項改變都會讓舊的上傳索引失效。
+# 調整編碼方式（格式、品質、縮放演算法）時請一併遞增版本號
+IMAGE_ENCODER_VERSION = 2
+IMAGE_ENCODER_SETTINGS = (
+    f"webp;v={IMAGE_ENCODER_VERSION};max={IMAGE_MAX_DIMENSION};widths={','.join(map(str, IMAGE_VARIANT_WIDTHS))}"
+)
+
+
+def add_image(data: bytes | bytearray, upload_key: str | None = None) -> ImageInfo | None:
     """
     新增圖片
 
-    :param data: 圖片資料字典
+    先以原始內容的雜湊查詢上傳索引，重複上傳的圖片不需要重新解碼與編碼。
+    呼叫端只需要圖片名稱，因此回傳描述資料，不讀取圖片內容。
+
+    :param data: 原始圖片的二進位資料
+    :param upload_key: 已經算好的上傳雜湊，未提供時由 `data` 計算
 
-    :return: 新增的圖片資料
+    :return: 新增的圖片描述資料
     """
-    db = get_db()
-    webp_data = convert_to_webp(data)
+    if upload_key is None:
+        upload_key = get_upload_key(data, IMAGE_ENCODER_SETTINGS)
+
+    info = get_image_by_upload_key(upload_key)
+    if info is not None:
+        return info  # 相同內容、相同設定已經上傳過
+
+    # 解碼與編碼交給行程池，不佔用請求執行緒的 GIL
+    webp_data, variants, width = get_image_encoder().encode(
+        data,
+        IMAGE_VARIANT_WIDTHS,
+        max_dimension=IMAGE_MAX_DIMENSION,
+        max_pixels=IMAGE_MAX_PIXELS,
+    )
     name = f"{get_uuid_from_data(webp_data)}.webp"
 
-    img = get_image_by_name(name=name)
+    info = get_image_info_by_name(name)
+    if info is not None:
+        # 不同的原始檔編碼出相同的圖片，記下這份原始檔後直接回傳
+        try:
+            with transaction() as cursor:
+                save_upload_key(cursor, upload_key, info.id)
+        except Exception as e:
+            print("Error saving image upload key:", e)
+
+        return info
 
-    if img is not None:
-        return img  # 圖片已存在，直接回傳
+    # 縮圖名稱 -> (縮圖寬度, 縮圖資料)
+    variants = {
+        get_variant_name(name, variant_width): (variant_width, variant) for variant_width, variant in variants.items()
+    }
 
     try:
-        with db.cursor() as cursor:
+        # 先寫入圖片內容，資料列寫入失敗時留下的檔案因為內容定址而無害
+        column = store_image_data(name, webp_data)
+        variant_columns = {
+            variant_name: store_image_data(variant_name, variant) for variant_name, (_, variant) in variants.items()
+        }
+
+        with transaction() as cursor:
             cursor.execute(
                 """
-                INSERT INTO image (name, data)
-                VALUES (%s, %s);
+                INSERT INTO image (name, data, size, width)
+                VALUES (%s, %s, %s, %s);
                 """,
-                (name, webp_data),
+                (name, column, len(webp_data), width),
             )
-            db.commit()
             image_id = cursor.lastrowid
+
+            # 縮圖與原圖一起寫入
+            if variants:
+                cursor.executemany(
+                    """
+                    INSERT INTO image (name, data, size, width)
+                    VALUES (%s, %s, %s, %s);
+                    """,
+                    [
+                        (variant_name, variant_columns[variant_name], len(variant), variant_width)
+                        for variant_name, (variant_width, variant) in variants.items()
+                    ],
+                )
+
+            save_upload_key(cursor, upload_key, image_id)
     except Exception as e:
         print("Error adding image:", e)
-        db.rollback()
         return None
 
-    return get_image_by_id(image_id)
+    image_variant_cache.invalidate()
+
+    return get_image_info_by_name(name)
+
+
+def get_image_by_upload_key(upload_key: str) -> ImageInfo | None:
+    """
+    透過原始上傳內容的雜湊取得圖片的描述資料（不含圖片內容）
+
+    :param upload_key: 上傳雜湊，見 `get_upload_key`
+
+    :return: 圖片描述資料或 None
+    """
+    db = get_db()
+
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT i.id, i.name, i.size, i.width, i.created_at
+                FROM image_upload u
+                JOIN image i ON i.id = u.image_id
+                WHERE u.upload_key = %s;
+                """,
+                (upload_key,),
+            )
+            row = cursor.fetchone()
+    except Exception as e:
+        print("Error fetching image by upload key:", e)
+        return None
+
+    if row is None:
+        return None
+
+    info = ImageInfo.from_row(row)
+    return get_identity_map().add(ImageInfo, info)
 
 
 def get_image_by_id(image_id: int) -> Image | None:
@@ -57,6 +310,11 @@ def get_image_by_id(image_id: int) -> Image | None:
 
     :return: 圖片資料或 None
     """
+    identity = get_identity_map()
+    image = identity.get(Image, image_id) or image_cache.get_by_id(image_id)
+    if image is not None:
+        return image
+
     db = get_db()
 
     try:
@@ -70,8 +328,16 @@ def get_image_by_id(image_id: int) -> Image | None:
     if row is None:
         return None
 
-    image = Image.model_validate(row)
-    return image
+    if row["data"] is None:
+        # 圖片內容不在資料庫中，由儲存後端讀取
+        row["data"] = read_image_data(row["name"])
+        if row["data"] is None:
+            print("Image data missing from storage:", row["name"])
+            return None
+
+    image = Image.from_row(row)
+    image_cache.put(image)
+    return identity.add(Image, image)
 
 
 def get_image_by_name(name: str) -> Image | None:
@@ -82,6 +348,11 @@ def get_image_by_name(name: str) -> Image | None:
 
     :return: 圖片資料或 None
     """
+    identity = get_identity_map()
+    image = identity.get_by_name(Image, name) or image_cache.get(name)
+    if image is not None:
+        return image
+
     db = get_db()
 
     try:
@@ -95,8 +366,58 @@ def get_image_by_name(name: str) -> Image | None:
     if row is None:
         return None
 
-    image = Image.model_validate(row)
-    return image
+    if row["data"] is None:
+        # 圖片內容不在資料庫中，由儲存後端讀取
+        row["data"] = read_image_data(row["name"])
+        if row["data"] is None:
+            print("Image data missing from storage:", row["name"])
+            return None
+
+    image = Image.from_row(row)
+    image_cache.put(image)
+    return identity.add(Image, image)
+
+
+def get_image_info_by_name(name: str) -> ImageInfo | None:
+    """
+    透過名稱取得圖片的描述資料（不含圖片內容）
+
+    :param name: 圖片名稱
+
+    :return: 圖片描述資料或 None
+    """
+    identity = get_identity_map()
+    info = identity.get_by_name(ImageInfo, name) or image_cache.peek(name)
+    if info is not None:
+        return info  # 快取中的 Image 本身就是 ImageInfo
+
+    db = get_db()
+
+    try:
+        with db.cursor() as cursor:
+            cursor.execute("SELECT id, name, size, width, created_at FROM image WHERE name = %s;", (name,))
+            row = cursor.fetchone()
+    except Exception as e:
+        print("Error fetching image info by name:", e)
+        return None
+
+    if row is None:
+        return None
+
+    info = ImageInfo.from_row(row)
+    return identity.add(ImageInfo, info)
+
+
+def get_image_path(name: str) -> str | None:
+    """
+    取得圖片在檔案系統上的路徑，可直接以 `send_file` 串流
+
+    :param name: 圖片名稱
+
+    :return: 檔案路徑，圖片不存放在檔案系統時回傳 None
+    """
+    storage = get_image_storage()
+    return storage.path(name) if storage is not None else None
 
 
 def delete_image_by_id(image_id: int) -> bool:
@@ -107,26 +428,484 @@ def delete_image_by_id(image_id: int) -> bool:
 
     :return: 是否刪除成功
     """
-    db = get_db()
     try:
-        with db.cursor() as cursor:
-            cursor.execute("DELETE FROM image WHERE id = %s;", (image_id,))
-            db.commit()
-            return cursor.rowcount > 0
+        with transaction() as cursor:
+            cursor.execute("SELECT name FROM image WHERE id = %s;", (image_id,))
+            row = cursor.fetchone()
+
+            if row is None:
+                return False
+
+            # 連同縮圖一起刪除
+            names = [row["name"]] + [get_variant_name(row["name"], width) for width in IMAGE_VARIANT_WIDTHS]
+            placeholders = ", ".join(["%s"] * len(names))
+            cursor.execute(f"SELECT id, name FROM image WHERE name IN ({placeholders});", names)
+            rows = cursor.fetchall()
+            cursor.execute(f"DELETE FROM image WHERE name IN ({placeholders});", names)
+            deleted = cursor.rowcount > 0
     except Exception as e:
         print("Error deleting image:", e)
-        db.rollback()
         return False
 
+    image_variant_cache.invalidate()
+
+    storage = get_image_storage()
+    identity = get_identity_map()
+
+    for row in rows:
+        if storage is not None:
+            storage.delete(row["name"])
+        identity.discard(Image, row["id"])
+        identity.discard(ImageInfo, row["id"])
+        image_cache.discard(row["id"])
+
+    return deleted
+
+
+def get_image_variant_widths(name: str) -> list[int]:
+    """
+    取得圖片實際產生的縮圖寬度
+
+    縮圖只在比原圖窄時才會產生，因此每張圖片的縮圖可能少於設定的寬度。
+
+    :param name: 原圖名稱
+
+    :return: 由小到大的寬度列表
+    """
+    return sorted(width for variant_name, width in get_image_widths(name).items() if variant_name != name)
+
+
+def get_image_width(name: str) -> int | None:
+    """
+    取得原圖的像素寬度
+
+    :param name: 原圖名稱
+
+    :return: 原圖寬度，圖片不存在或寬度未記錄時回傳 None
+    """
+    return get_image_widths(name).get(name) or None
+
+
+def get_image_encoder_stats() -> dict:
+    """
+    取得圖片編碼行程池的統計
+
+    :return: 包含工作數量、排隊中數量、拒絕次數與平均/最大等待及編碼耗時的字典
+    """
+    return get_image_encoder().stats()
+
+
+def get_image_variant_name(name: str, width: int | None) -> str:
+    """
+    依要求的寬度選擇最接近的縮圖
+
+    只考慮實際產生的縮圖（見 `get_image_variant_widths`，已快取），選擇不小於要求寬度的最小縮圖；
+    沒有這樣的縮圖時回傳原圖，避免對不存在的縮圖名稱查詢資料庫。
+
+    :param name: 原圖名稱
+    :param width: 要求的寬度
+
+    :return: 縮圖或原圖的名稱
+    """
+    if not width:
+        return name
+
+    for variant_width in get_image_variant_widths(name):
+        if variant_width >= width:
+            return get_variant_name(name, variant_width)
+
+    return name
+
+
+def move_images_to_storage(batch_size: int = 100) -> int:
+    """
+    將仍存放在 `image.data` 欄位的圖片內容搬移到檔案系統儲存後端
+
+    先將舊的資料表升級到目前的結構並補上 `size`，
+    再逐批寫入檔案，並於同一個交易中清空該批的 `data` 欄位。
+
+    :param batch_size: 每批處理的圖片數量
+
+    :return: 搬移的圖片數量
+    """
+    storage = get_image_storage()
+
+    if storage is None:
+        raise RuntimeError("Set IMAGE_STORAGE=filesystem before moving images out of the database.")
+
+    db = get_db()
+    moved = 0
+
+    with db.cursor() as cursor:
+        upgrade_image_table(cursor)
+
+        # 清空 data 之前先以內容長度補上 size，HEAD 請求與描述資料查詢都依賴這個欄位
+        cursor.execute("UPDATE image SET size = LENGTH(data) WHERE data IS NOT NULL;")
+    db.commit()
+
+    while True:
+        with transaction() as cursor:
+            cursor.execute(
+                """
+                SELECT id, name, data FROM image
+                WHERE data IS NOT NULL
+                LIMIT %s;
+                """,
+                (batch_size,),
+            )
+            rows = cursor.fetchall()
+
+            if not rows:
+                break
+
+            for row in rows:
+                storage.write(row["name"], row["data"])
+
+            cursor.executemany(
+                """
+                UPDATE image SET data = NULL WHERE id = %s;
+                """,
+                [(row["id"],) for row in rows],
+            )
+
+        moved += len(rows)
+        print(f"Moved {moved} images to storage")
+
+    return moved
+
+
+def import_images(directory: str, workers: int | None = None, batch_size: int = 50) -> dict[str, str]:
+    """
+    批次匯入目錄（含子目錄）中的圖片
+
+    先以原始內容雜湊去除重複的檔案與已匯入過的圖片，其餘檔案交給行程池平行編碼，
+    完成的圖片每 `batch_size` 張在同一個交易中寫入。
+
+    :param directory: 圖片目錄
+    :param workers: 工作行程數量，預設為 CPU 核心數
+    :param batch_size: 每個交易寫入的圖片數量
+
+    :return: 檔案路徑（相對於 directory）-> 圖片名稱 的字典
+    """
+    started = time.perf_counter()
+
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file in sorted(files):
+            if not file.startswith(".") and file.lower().endswith(IMPORT_IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, file))
+
+    # 檔案路徑 -> 上傳雜湊
+    keys = {path: get_file_upload_key(path) for path in paths}
+
+    # 上傳雜湊 -> 圖片名稱，先放入已經匯入過的圖片
+    names = get_image_names_by_upload_keys(list(set(keys.values())))
+
+    # 需要編碼的圖片：上傳雜湊 -> 第一個內容相同的檔案
+    pending: dict[str, str] = {}
+    for path, key in keys.items():
+        if key not in names:
+            pending.setdefault(key, path)
+
+    print(f"Found {len(paths)} image files, {len(pending)} to encode.")
+
+    if pending:
+        executor = ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+        with executor:
+            futures = {
+                executor.submit(
+                    encode_image_file,
+                    path,
+                    IMAGE_VARIANT_WIDTHS,
+                    IMAGE_MAX_DIMENSION,
+                    IMAGE_MAX_PIXELS,
+                ): key
+                for key, path in pending.items()
+            }
+
+            batch = []
+            for done, future in enumerate(as_completed(futures), 1):
+                key = futures[future]
+                path = pending[key]
+                label = f"[{done}/{len(futures)}] {os.path.relpath(path, directory)}"
+
+                try:
+                    webp_data, variants, width, elapsed = future.result()
+                except Exception as e:
+                    print(f"{label}: error:", e)
+                    continue
+
+                name = f"{get_uuid_from_data(webp_data)}.webp"
+                size = os.path.getsize(path)
+                print(
+                    f"{label} -> {name} "
+                    f"({size / 1024:.0f} KiB in {elapsed * 1000:.0f} ms, {size / elapsed / 1024 / 1024:.1f} MiB/s)"
+                )
+
+                batch.append((key, name, webp_data, width, variants))
+                if len(batch) >= batch_size:
+                    # 寫入的同時其他工作行程繼續編碼
+                    names.update(save_imported_images(batch))
+                    batch = []
+
+            if batch:
+                names.update(save_imported_images(batch))
+
+    elapsed = time.perf_counter() - started
+    print(f"Imported {len(paths)} files in {elapsed:.2f} s ({len(paths) / elapsed if elapsed else 0:.1f} files/s).")
+
+    return {os.path.relpath(path, directory): names[key] for path, key in keys.items() if key in names}
+
 
 # ====================
 # Helpers
 # ====================
 
 
+def store_image_data(name: str, data: bytes) -> bytes | None:
+    """
+    存放圖片內容
+
+    設定了儲存後端時寫入後端，回傳 None 讓 `image.data` 欄位保持 NULL；
+    否則回傳圖片內容本身，由呼叫端寫入 `image.data` 欄位。
+
+    :param name: 圖片名稱
+    :param data: 圖片內容
+
+    :return: 要寫入 `image.data` 欄位的值
+    """
+    storage = get_image_storage()
+
+    if storage is None:
+        return data
+
+    storage.write(name, data)
+    return None
+
+
+def read_image_data(name: str) -> bytes | None:
+    """
+    由儲存後端讀取圖片內容
+
+    :param name: 圖片名稱
+
+    :return: 圖片內容，沒有設定儲存後端或檔案不存在時回傳 None
+    """
+    storage = get_image_storage()
+    return storage.read(name) if storage is not None else None
+
+
+def get_image_widths(name: str) -> dict[str, int]:
+    """
+    查詢原圖與實際產生的縮圖的像素寬度
+
+    結果會被快取，圖片有任何新增或刪除時失效。
+
+    :param name: 原圖名稱
+
+    :return: 原圖或縮圖名稱 -> 寬度 的字典，只包含存在的圖片
+    """
+
+    def load():
+        names = [name] + [get_variant_name(name, width) for width in IMAGE_VARIANT_WIDTHS]
+
+        db = get_db()
+        placeholders = ", ".join(["%s"] * len(names))
+
+        try:
+            with db.cursor() as cursor:
+                cursor.execute(f"SELECT name, width FROM image WHERE name IN ({placeholders});", names)
+                rows = cursor.fetchall()
+        except Exception as e:
+            print("Error fetching image widths:", e)
+            return None
+
+        return {row["name"]: row["width"] for row in rows}
+
+    return image_variant_cache.get_or_load(name, load) or {}
+
+
+def upgrade_image_table(cursor):
+    """
+    將舊版的 `image` 資料表升級到 `schema.sql` 的結構
+
+    舊的資料表 `data` 欄位為 NOT NULL，也沒有 `size` 與 `width` 欄位。
+    `width` 無法在不解碼的情況下補上，維持 0（未知），這些圖片不會產生 `srcset`。
+
+    :param cursor: 資料庫游標
+    """
+    cursor.execute(
+        """
+        SELECT COLUMN_NAME AS name FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'image';
+        """
+    )
+    columns = {row["name"] for row in cursor.fetchall()}
+
+    cursor.execute("ALTER TABLE image MODIFY `data` LONGBLOB NULL;")
+
+    if "size" not in columns:
+        cursor.execute("ALTER TABLE image ADD COLUMN `size` INT UNSIGNED NOT NULL DEFAULT 0 AFTER `data`;")
+    if "width" not in columns:
+        cursor.execute("ALTER TABLE image ADD COLUMN `width` INT UNSIGNED NOT NULL DEFAULT 0 AFTER `size`;")
+
+
+def get_file_upload_key(path: str) -> str:
+    """
+    分段讀取檔案並計算上傳雜湊
+
+    :param path: 圖片檔案路徑
+
+    :return: 上傳雜湊
+    """
+    hasher = new_upload_hasher(IMAGE_ENCODER_SETTINGS)
+
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+
+def get_image_names_by_upload_keys(upload_keys: list[str]) -> dict[str, str]:
+    """
+    批次查詢上傳雜湊對應的圖片名稱
+
+    :param upload_keys: 上傳雜湊列表
+
+    :return: 上傳雜湊 -> 圖片名稱 的字典
+    """
+    if not upload_keys:
+        return {}
+
+    db = get_db()
+    placeholders = ", ".join(["%s"] * len(upload_keys))
+
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT u.upload_key, i.name
+                FROM image_upload u
+                JOIN image i ON i.id = u.image_id
+                WHERE u.upload_key IN ({placeholders});
+                """,
+                upload_keys,
+            )
+            rows = cursor.fetchall()
+    except Exception as e:
+        print("Error fetching images by upload keys:", e)
+        return {}
+
+    return {row["upload_key"]: row["name"] for row in rows}
+
+
+def save_imported_images(batch: list[tuple[str, str, bytes, int, dict[int, bytes]]]) -> dict[str, str]:
+    """
+    在同一個交易中寫入一批編碼完成的圖片、縮圖與上傳索引
+
+    內容相同的圖片（名稱重複）會被略過，只補上上傳索引。
+
+    :param batch: (上傳雜湊, 圖片名稱, WebP 資料, 原圖寬度, 寬度 -> 縮圖資料) 的列表
+
+    :return: 上傳雜湊 -> 圖片名稱 的字典
+    """
+    rows = []
+
+    try:
+        for _, name, webp_data, width, variants in batch:
+            rows.append((name, store_image_data(name, webp_data), len(webp_data), width))
+
+            for variant_width, variant in variants.items():
+                variant_name = get_variant_name(name, variant_width)
+                rows.append((variant_name, store_image_data(variant_name, variant), len(variant), variant_width))
+
+        image_names = list({name for _, name, _, _, _ in batch})
+        placeholders = ", ".join(["%s"] * len(image_names))
+
+        with transaction() as cursor:
+            cursor.executemany(
+                """
+                INSERT INTO image (name, data, size, width)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE name = name;
+                """,
+                rows,
+            )
+
+            # 多列 INSERT 只回傳第一個 ID，重新查詢原圖的 ID
+            cursor.execute(f"SELECT id, name FROM image WHERE name IN ({placeholders});", image_names)
+            ids = {row["name"]: row["id"] for row in cursor.fetchall()}
+
+            cursor.executemany(
+                """
+                INSERT INTO image_upload (upload_key, image_id)
+                VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE image_id = VALUES(image_id);
+                """,
+                [(key, ids[name]) for key, name, _, _, _ in batch],
+            )
+    except Exception as e:
+        print("Error saving imported images:", e)
+        return {}
+
+    image_variant_cache.invalidate()
+
+    return {key: name for key, name, _, _, _ in batch}
+
+
+def save_upload_key(cursor, upload_key: str, image_id: int):
+    """
+    記錄原始上傳內容對應的圖片
+
+    :param cursor: 交易中的資料庫游標
+    :param upload_key: 上傳雜湊
+    :param image_id: 圖片 ID
+    """
+    cursor.execute(
+        """
+        INSERT INTO image_upload (upload_key, image_id)
+        VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE image_id = VALUES(image_id);
+        """,
+        (upload_key, image_id),
+    )
+
+
+def read_upload(file: FileStorage) -> tuple[bytearray, str]:
+    """
+    分段讀取上傳的檔案，同時計算上傳雜湊並檢查位元組上限
+
+    直接回傳讀取用的 bytearray，不再複製成 bytes，避免記憶體用量加倍。
+
+    :param file: 上傳的檔案物件
+
+    :return: (原始圖片的二進位資料, 上傳雜湊)
+    """
+    hasher = new_upload_hasher(IMAGE_ENCODER_SETTINGS)
+    buf = bytearray()
+
+    while chunk := file.stream.read(UPLOAD_CHUNK_SIZE):
+        if len(buf) + len(chunk) > IMAGE_MAX_UPLOAD_BYTES:
+            # 超過上限就停止讀取，不把剩下的內容載入記憶體
+            raise RequestEntityTooLarge(f"Image exceeds the {IMAGE_MAX_UPLOAD_BYTES} bytes upload limit.")
+
+        hasher.update(chunk)
+        buf += chunk
+
+    return buf, hasher.hexdigest()
+
+
 def process_image_upload(data: dict, default_path=""):
     """
     處理可能有的圖片上傳，並修改成圖片網址
+
+    圖片超過位元組或像素上限時拋出 `RequestEntityTooLarge`（413）。
     """
 
     if "image" not in data or not data["image"]:
@@ -134,13 +913,20 @@ def process_image_upload(data: dict, default_path=""):
             data["image_url"] = default_path
         return data
 
-    if isinstance(data["image"], bytes):
+    if isinstance(data["image"], (bytes, bytearray)):
         buf = data["image"]
+        if len(buf) > IMAGE_MAX_UPLOAD_BYTES:
+            raise RequestEntityTooLarge(f"Image exceeds the {IMAGE_MAX_UPLOAD_BYTES} bytes upload limit.")
+        upload_key = None
     elif isinstance(data["image"], FileStorage):
         # 上傳的是檔案物件
-        buf = data["image"].stream.read()
+        buf, upload_key = read_upload(data["image"])
+
+    try:
+        img = add_image(buf, upload_key)
+    except ImageTooLarge as e:
+        raise RequestEntityTooLarge(str(e))
 
-    img = add_image(buf)
     data["image_url"] = "/images/" + img.name
     del data["image"]
 
@@ -1,12 +1,18 @@
-from app.db import get_db
-from app.models import Dish, Ingredient, Supplier
+from app.db import get_db, transaction
+from app.models import Dish, Ingredient, IngredientRow, Supplier
+
+from .cache import ingredient_count_cache
+from .identity import get_identity_map
+from .utils import decode_cursor, encode_cursor
 
 __all__ = [
     "add_ingredient",
     "get_ingredients",
+    "get_ingredients_page",
     "count_ingredients",
     "get_ingredient_by_id",
     "get_ingredient_by_name",
+    "get_ingredients_by_names",
     "update_ingredient_by_id",
     "delete_ingredient_by_id",
     "get_suppliers_by_ingredient",
@@ -22,12 +28,10 @@ def add_ingredient(data: dict):
 
     :return: 新增的食材資料或 None
     """
-    db = get_db()
-
     ingredient = Ingredient.model_validate(data)
 
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 INSERT INTO ingredient (name)
@@ -35,75 +39,151 @@ def add_ingredient(data: dict):
                 """,
                 (ingredient.name,),
             )
-            db.commit()
             ingredient_id = cursor.lastrowid
     except Exception as e:
         print("Error adding ingredient:", e)
-        db.rollback()
         return None
 
+    ingredient_count_cache.invalidate()
+
     return get_ingredient_by_id(ingredient_id)
 
 
-def count_ingredients(keyword: str = ""):
+def count_ingredients(keyword: str = "", cached_only: bool = False):
     """
     計算食材總數
 
+    結果依關鍵字快取，食材有任何寫入時失效，不需要每次載入頁面都掃描整個資料表。
+
     :param keyword: 搜尋關鍵字
+    :param cached_only: 只回傳快取中的數量，不查詢資料庫
 
-    :return: 食材總數
+    :return: 食材總數，`cached_only` 且沒有快取或查詢失敗時回傳 None
     """
-    db = get_db()
-
-    try:
-        with db.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT COUNT(*) AS total FROM ingredient
-                WHERE name LIKE %s;
-                """,
-                (f"%{keyword}%",),
-            )
-            row = cursor.fetchone()
-    except Exception as e:
-        print("Error counting ingredients:", e)
-        return 0
-
-    total = row["total"] if row else 0
-
-    return total
-
-
-def get_ingredients(keyword: str = "", offset: int = 0, limit: int = 100):
+    if cached_only:
+        return ingredient_count_cache.get(keyword)
+
+    def load():
+        db = get_db()
+
+        try:
+            with db.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT COUNT(*) AS total FROM ingredient
+                    WHERE name LIKE %s;
+                    """,
+                    (f"%{keyword}%",),
+                )
+                row = cursor.fetchone()
+        except Exception as e:
+            print("Error counting ingredients:", e)
+            return None
+
+        return row["total"] if row else 0
+
+    return ingredient_count_cache.get_or_load(keyword, load)
+
+
+def get_ingredients(
+    keyword: str = "",
+    after: tuple[str, int] | None = None,
+    before: tuple[str, int] | None = None,
+    limit: int = 100,
+):
     """
     取得食材列表
 
+    供列表頁面使用，回傳輕量的唯讀資料列而不是 pydantic 模型。
+    以 (名稱, ID) 排序並使用 keyset 分頁：`after` / `before` 為相鄰頁面邊界的排序鍵，
+    資料庫沿著 `name` 的唯一索引從邊界開始讀取，不需要像 OFFSET 一樣掃過前面所有的資料列。
+
     :param keyword: 搜尋關鍵字
+    :param after: 只取得排在此 (名稱, ID) 之後的食材
+    :param before: 只取得排在此 (名稱, ID) 之前的食材（取最接近邊界的 `limit` 筆）
+    :param limit: 最多取得的數量
 
-    :return: 食材列表
+    :return: 依 (名稱, ID) 遞增排序的食材資料列列表
     """
     db = get_db()
 
+    conditions = "name LIKE %s"
+    params: tuple = (f"%{keyword}%",)
+    order = "ASC"
+
+    if after is not None:
+        conditions += " AND (name > %s OR (name = %s AND id > %s))"
+        params += (after[0], after[0], after[1])
+
+    if before is not None:
+        conditions += " AND (name < %s OR (name = %s AND id < %s))"
+        params += (before[0], before[0], before[1])
+        # 往前翻頁時反向讀取最接近邊界的資料列，取得後再轉回遞增順序
+        order = "DESC" if after is None else "ASC"
+
     try:
         with db.cursor() as cursor:
             cursor.execute(
-                """
+                f"""
                 SELECT * FROM ingredient
-                WHERE name LIKE %s
-                LIMIT %s OFFSET %s;
+                WHERE {conditions}
+                ORDER BY name {order}, id {order}
+                LIMIT %s;
                 """,
-                (f"%{keyword}%", limit, offset),
+                params + (limit,),
             )
             rows = cursor.fetchall()
     except Exception as e:
         print("Error fetching ingredients:", e)
         return []
 
-    ingredients = [Ingredient.model_validate(row) for row in rows]
+    ingredients = IngredientRow.from_rows(rows)
+
+    if order == "DESC":
+        ingredients.reverse()
 
     return ingredients
 
 
+def get_ingredients_page(keyword: str = "", after: str = "", before: str = "", per_page: int = 20):
+    """
+    取得一頁食材與相鄰頁面的游標
+
+    多取一筆判斷該方向是否還有資料；從 `after` 往後翻時前一頁一定存在，反之亦然。
+
+    :param keyword: 搜尋關鍵字
+    :param after: 下一頁游標，取得排在游標之後的食材
+    :param before: 上一頁游標，取得排在游標之前的食材
+    :param per_page: 每頁數量
+
+    :return: 包含 `ingredients`、`next`（下一頁游標或 None）、`prev`（上一頁游標或 None）的字典
+
+    :raises ValueError: 游標格式錯誤
+    """
+    after_key = decode_cursor(after, (str, int)) if after else None
+    before_key = decode_cursor(before, (str, int)) if before else None
+
+    if before_key is not None and after_key is None:
+        ingredients = get_ingredients(keyword, before=before_key, limit=per_page + 1)
+        has_prev = len(ingredients) > per_page
+        has_next = True
+        ingredients = ingredients[-per_page:] if has_prev else ingredients
+    else:
+        ingredients = get_ingredients(keyword, after=after_key, before=before_key, limit=per_page + 1)
+        has_prev = after_key is not None
+        has_next = len(ingredients) > per_page
+        ingredients = ingredients[:per_page]
+
+    first = ingredients[0] if ingredients else None
+    last = ingredients[-1] if ingredients else None
+
+    return {
+        "ingredients": ingredients,
+        "next": encode_cursor(last.name, last.id) if has_next and last else None,
+        "prev": encode_cursor(first.name, first.id) if has_prev and first else None,
+    }
+
+
 def get_ingredient_by_id(ingredient_id: int):
     """
     透過 ID 取得食材資料
@@ -112,6 +192,11 @@ def get_ingredient_by_id(ingredient_id: int):
 
     :return: 食材資料或 None
     """
+    identity = get_identity_map()
+    ingredient = identity.get(Ingredient, ingredient_id)
+    if ingredient is not None:
+        return ingredient
+
     db = get_db()
     try:
         with db.cursor() as cursor:
@@ -129,8 +214,8 @@ def get_ingredient_by_id(ingredient_id: int):
     if row is None:
         return None
 
-    ingredient = Ingredient.model_validate(row)
-    return ingredient
+    ingredient = Ingredient.from_row(row)
+    return identity.add(Ingredient, ingredient)
 
 
 def get_ingredient_by_name(ingredient_name: str):
@@ -141,6 +226,11 @@ def get_ingredient_by_name(ingredient_name: str):
 
     :return: 食材資料或 None
     """
+    identity = get_identity_map()
+    ingredient = identity.get_by_name(Ingredient, ingredient_name)
+    if ingredient is not None:
+        return ingredient
+
     db = get_db()
 
     try:
@@ -159,8 +249,86 @@ def get_ingredient_by_name(ingredient_name: str):
     if row is None:
         return None
 
-    ingredient = Ingredient.model_validate(row)
-    return ingredient
+    ingredient = Ingredient.from_row(row)
+    return identity.add(Ingredient, ingredient)
+
+
+def get_ingredients_by_names(ingredient_names: list[str], create: bool = True):
+    """
+    透過多個名稱一次取得食材資料
+
+    以單一 `SELECT ... WHERE name IN (...)` 查詢，不存在的食材（`create` 為真時）
+    再以單一多列 `INSERT ... ON DUPLICATE KEY UPDATE` 一次新增。
+
+    :param ingredient_names: 食材名稱列表
+    :param create: 是否自動新增不存在的食材
+
+    :return: 食材名稱 -> 食材資料 的字典，找不到的名稱不會出現在字典中
+    """
+    identity = get_identity_map()
+    ingredients: dict[str, Ingredient] = {}
+    missing = []
+
+    for name in dict.fromkeys(ingredient_names):
+        ingredient = identity.get_by_name(Ingredient, name)
+        if ingredient is not None:
+            ingredients[name] = ingredient
+        else:
+            missing.append(name)
+
+    if not missing:
+        return ingredients
+
+    # 資料庫的比對不分大小寫
+    by_key: dict[str, Ingredient] = {}
+
+    try:
+        with transaction() as cursor:
+            placeholders = ", ".join(["%s"] * len(missing))
+            cursor.execute(
+                f"""
+                SELECT * FROM ingredient WHERE name IN ({placeholders});
+                """,
+                missing,
+            )
+            rows = list(cursor.fetchall())
+
+            found = {row["name"].casefold() for row in rows}
+            to_adds = list({name.casefold(): name for name in missing if name.casefold() not in found}.values())
+
+            if create and to_adds:
+                cursor.executemany(
+                    """
+                    INSERT INTO ingredient (name)
+                    VALUES (%s)
+                    ON DUPLICATE KEY UPDATE name = name;
+                    """,
+                    [(name,) for name in to_adds],
+                )
+
+                placeholders = ", ".join(["%s"] * len(to_adds))
+                cursor.execute(
+                    f"""
+                    SELECT * FROM ingredient WHERE name IN ({placeholders});
+                    """,
+                    to_adds,
+                )
+                rows.extend(cursor.fetchall())
+    except Exception as e:
+        print("Error fetching ingredients by names:", e)
+        return ingredients
+
+    if create and to_adds:
+        ingredient_count_cache.invalidate()
+
+    for ingredient in Ingredient.from_rows(rows):
+        by_key[ingredient.name.casefold()] = identity.add(Ingredient, ingredient)
+
+    for name in missing:
+        if name.casefold() in by_key:
+            ingredients[name] = by_key[name.casefold()]
+
+    return ingredients
 
 
 def update_ingredient_by_id(ingredient_id: int, data: dict):
@@ -172,11 +340,10 @@ def update_ingredient_by_id(ingredient_id: int, data: dict):
 
     :return: 更新後的食材資料或 None
     """
-    db = get_db()
     ingredient = Ingredient.model_validate(data)
 
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 UPDATE ingredient
@@ -185,12 +352,12 @@ def update_ingredient_by_id(ingredient_id: int, data: dict):
                 """,
                 (ingredient.name, ingredient_id),
             )
-            db.commit()
     except Exception as e:
         print("Error updating ingredient:", e)
-        db.rollback()
         return None
 
+    invalidate_ingredient(ingredient_id)
+
     return get_ingredient_by_id(ingredient_id)
 
 
@@ -202,23 +369,36 @@ def delete_ingredient_by_id(ingredient_id: int):
 
     :return: 是否刪除成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 DELETE FROM ingredient WHERE id = %s;
                 """,
                 (ingredient_id,),
             )
-            db.commit()
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
     except Exception as e:
         print("Error deleting ingredient:", e)
-        db.rollback()
         return False
 
+    invalidate_ingredient(ingredient_id)
+
+    return deleted
+
+
+def invalidate_ingredient(ingredient_id: int):
+    """
+    使食材及內含該食材的餐點、供應商的請求快取，以及食材數量的快取失效
+
+    :param ingredient_id: 食材 ID
+    """
+    identity = get_identity_map()
+    identity.discard(Ingredient, ingredient_id)
+    identity.clear(Dish)
+    identity.clear(Supplier)
+    ingredient_count_cache.invalidate()
+
 
 # ====================
 # Ingredient from Suppliers
@@ -250,7 +430,7 @@ def get_suppliers_by_ingredient(ingredient: Ingredient):
         print("Error fetching suppliers by ingredient:", e)
         return []
 
-    suppliers = [Supplier.model_validate(row) for row in rows]
+    suppliers = Supplier.from_rows(rows)
 
     return suppliers
 
@@ -285,6 +465,6 @@ def get_dishes_by_ingredient(ingredient: Ingredient):
         print("Error fetching dishes by ingredient:", e)
         return []
 
-    dishes = [Dish.model_validate(row) for row in rows]
+    dishes = Dish.from_rows(rows)
 
     return dishes
@@ -0,0 +1,399 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app.models import StoreRow
+
+from .schedule import WeeklySchedule, get_local_time, is_open, to_minute
+from .utils import KM_PER_DEGREE, get_bounding_box
+
+__all__ = [
+    "EARTH_RADIUS_KM",
+    "haversine_km",
+    "StoreLocator",
+    "store_locator",
+]
+
+# 地球平均半徑（公里）
+EARTH_RADIUS_KM = 6371.0
+
+# 半個地球圓周，任兩點的球面距離都不會超過這個值
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+
+# 批次查詢時距離矩陣每個分塊的記憶體上限
+DISTANCE_MATRIX_BYTES = 32 * 1024 * 1024
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    以 haversine 公式計算球面距離，參數皆為弧度，支援 NumPy 廣播
+
+    :param lat1: 起點緯度
+    :param lon1: 起點經度
+    :param lat2: 終點緯度
+    :param lon2: 終點經度
+
+    :return: 距離（公里）
+    """
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    """
+    將經緯度轉換為單位球面上的三維向量
+
+    :param lat: 緯度陣列（弧度）
+    :param lon: 經度陣列（弧度）
+
+    :return: 形狀為 (n, 3) 的陣列
+    """
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+class StoreLocator:
+    """
+    記憶體內的商店位置索引
+
+    商店座標以弧度存放在 NumPy 陣列中，並依經緯度切成 `cell_size` 度的網格。
+    半徑查詢只對方框內網格的商店計算距離；k 近鄰查詢則由小到大擴大半徑，直到找到足夠的商店。
+
+    新增、更新、刪除商店時以 `upsert` / `remove` 就地更新，不需要重新載入；
+    `ttl` 秒後或呼叫 `invalidate` 後視為過期，由呼叫端重新載入，以同步其他行程的寫入。
+    """
+
+    def __init__(self, cell_size: float = 0.5, ttl: float = 300):
+        self.cell_size = cell_size
+        self.ttl = ttl
+        self.loaded_at: float | None = None
+
+        self._lock = threading.RLock()
+        self._reset(0)
+
+    def _reset(self, capacity: int):
+        capacity = max(capacity, 16)
+
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._lat = np.zeros(capacity, dtype=np.float64)  # 弧度
+        self._lon = np.zeros(capacity, dtype=np.float64)  # 弧度
+        self._active = np.zeros(capacity, dtype=bool)
+
+        # 營業時間，見 `WeeklySchedule`
+        self._weekday_mask = np.zeros(capacity, dtype=np.int16)
+        self._open_minute = np.zeros(capacity, dtype=np.int16)
+        self._close_minute = np.zeros(capacity, dtype=np.int16)
+        self._zones = np.zeros(capacity, dtype=np.int16)  # 時區在 `_timezones` 中的位置
+        self._timezones: list[str] = []
+        self._timezone_ids: dict[str, int] = {}
+
+        self._stores: list[StoreRow | None] = [None] * capacity
+        self._names: list[str] = [""] * capacity  # casefold 後的名稱，供關鍵字篩選
+
+        self._slots: dict[int, int] = {}  # 商店 ID -> 陣列位置
+        self._free: list[int] = list(range(capacity - 1, -1, -1))
+        self._cells: dict[tuple[int, int], set[int]] = {}  # 網格 -> 陣列位置
+        self._slot_cells: dict[int, tuple[int, int]] = {}  # 陣列位置 -> 網格
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _cell(self, latitude: float, longitude: float) -> tuple[int, int]:
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    def _grow(self):
+        capacity = len(self._ids)
+        extra = capacity
+
+        self._ids = np.concatenate([self._ids, np.zeros(extra, dtype=np.int64)])
+        self._lat = np.concatenate([self._lat, np.zeros(extra, dtype=np.float64)])
+        self._lon = np.concatenate([self._lon, np.zeros(extra, dtype=np.float64)])
+        self._active = np.concatenate([self._active, np.zeros(extra, dtype=bool)])
+        self._weekday_mask = np.concatenate([self._weekday_mask, np.zeros(extra, dtype=np.int16)])
+        self._open_minute = np.concatenate([self._open_minute, np.zeros(extra, dtype=np.int16)])
+        self._close_minute = np.concatenate([self._close_minute, np.zeros(extra, dtype=np.int16)])
+        self._zones = np.concatenate([self._zones, np.zeros(extra, dtype=np.int16)])
+
+        self._stores.extend([None] * extra)
+        self._names.extend([""] * extra)
+        self._free.extend(range(capacity + extra - 1, capacity - 1, -1))
+
+    # ====================
+    # Maintenance
+    # ====================
+
+    def is_stale(self) -> bool:
+        """
+        是否需要重新載入
+        """
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    def invalidate(self):
+        """
+        標記為過期，下次查詢時重新載入
+        """
+        with self._lock:
+            self.loaded_at = None
+
+    def load(self, stores: list[StoreRow]):
+        """
+        以完整的商店列表重建索引
+
+        :param stores: 商店資料列表
+        """
+        with self._lock:
+            self._reset(len(stores) * 2)
+            for store in stores:
+                self.upsert(store)
+            self.loaded_at = time.monotonic()
+
+    def upsert(self, store: StoreRow):
+        """
+        新增或更新一間商店
+
+        :param store: 商店資料
+        """
+        with self._lock:
+            slot = self._slots.get(store.id)
+            if slot is None:
+                if not self._free:
+                    self._grow()
+                slot = self._free.pop()
+                self._slots[store.id] = slot
+            else:
+                self._cells[self._slot_cells[slot]].discard(slot)
+
+            self._ids[slot] = store.id
+            self._lat[slot] = math.radians(store.latitude)
+            self._lon[slot] = math.radians(store.longitude)
+            self._active[slot] = True
+            self._stores[slot] = store
+
+            schedule = WeeklySchedule.from_store(store)
+            self._weekday_mask[slot] = schedule.weekday_mask
+            self._open_minute[slot] = schedule.open_minute
+            self._close_minute[slot] = schedule.close_minute
+            zone = self._timezone_ids.get(store.timezone)
+            if zone is None:
+                zone = self._timezone_ids[store.timezone] = len(self._timezones)
+                self._timezones.append(store.timezone)
+            self._zones[slot] = zone
+            self._names[slot] = store.name.casefold()
+
+            cell = self._cell(store.latitude, store.longitude)
+            self._cells.setdefault(cell, set()).add(slot)
+            self._slot_cells[slot] = cell
+
+    def remove(self, store_id: int):
+        """
+        移除一間商店
+
+        :param store_id: 商店 ID
+        """
+        with self._lock:
+            slot = self._slots.pop(store_id, None)
+            if slot is None:
+                return
+
+            cell = self._slot_cells.pop(slot)
+            self._cells[cell].discard(slot)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+            self._active[slot] = False
+            self._stores[slot] = None
+            self._names[slot] = ""
+            self._free.append(slot)
+
+    # ====================
+    # Queries
+    # ====================
+
+    def _candidates(self, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+        lat_min, lon_min, lat_max, lon_max = get_bounding_box(latitude, longitude, radius_km)
+        (i_min, j_min), (i_max, j_max) = self._cell(lat_min, lon_min), self._cell(lat_max, lon_max)
+
+        if (i_max - i_min + 1) * (j_max - j_min + 1) > len(self._cells):
+            # 方框涵蓋的網格比有商店的網格還多，直接掃描全部商店
+            return np.flatnonzero(self._active)
+
+        slots = []
+        for i in range(i_min, i_max + 1):
+            for j in range(j_min, j_max + 1):
+                slots.extend(self._cells.get((i, j), ()))
+
+        return np.fromiter(slots, dtype=np.int64, count=len(slots))
+
+    def _filter(self, slots: np.ndarray, keyword: str, open_at: datetime | None = None) -> np.ndarray:
+        if open_at is not None and len(slots):
+            # 每個時區只換算一次當地時間，再以陣列一次判斷營業時間
+            local_times = [get_local_time(open_at, timezone) for timezone in self._timezones]
+            weekdays = np.array([local.weekday() for local in local_times], dtype=np.int16)
+            minutes = np.array([to_minute(local) for local in local_times], dtype=np.int16)
+            zones = self._zones[slots]
+
+            opened = is_open(
+                self._weekday_mask[slots],
+                self._open_minute[slots],
+                self._close_minute[slots],
+                weekdays[zones],
+                minutes[zones],
+            )
+            slots = slots[opened]
+
+        if not keyword or not len(slots):
+            return slots
+
+        keyword = keyword.casefold()
+        return slots[[keyword in self._names[slot] for slot in slots]]
+
+    def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        keyword: str = "",
+        open_at: datetime | None = None,
+    ) -> list[tuple[StoreRow, float]]:
+        """
+        取得半徑內的商店，依距離排序
+
+        :param latitude: 緯度
+        :param longitude: 經度
+        :param radius_km: 半徑（公里）
+        :param keyword: 商店名稱關鍵字（不分大小寫）
+        :param open_at: 只取得此時間營業中的商店
+
+        :return: (商店, 距離公里) 的列表，沒有指定經緯度時回傳空列表
+        """
+        if latitude is None or longitude is None:
+            return []
+
+        with self._lock:
+            slots = self._filter(self._candidates(latitude, longitude, radius_km), keyword, open_at)
+            if not len(slots):
+                return []
+
+            distances = haversine_km(
+                math.radians(latitude), math.radians(longitude), self._lat[slots], self._lon[slots]
+            )
+            inside = distances <= radius_km
+            slots, distances = slots[inside], distances[inside]
+
+            order = np.argsort(distances, kind="stable")
+            return [(self._stores[slots[i]], float(distances[i])) for i in order]
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int = 1,
+        keyword: str = "",
+        open_at: datetime | None = None,
+    ) -> list[tuple[StoreRow, float]]:
+        """
+        取得最近的 k 間商店
+
+        從一個網格大小的半徑開始，找不到 k 間就把半徑加倍。半徑查詢的結果是完整的，
+        因此只要找到 k 間以上，前 k 間就是真正的最近鄰。
+
+        :param latitude: 緯度
+        :param longitude: 經度
+        :param k: 商店數量
+        :param keyword: 商店名稱關鍵字（不分大小寫）
+        :param open_at: 只取得此時間營業中的商店
+
+        :return: (商店, 距離公里) 的列表，依距離排序，沒有指定經緯度時回傳空列表
+        """
+        if latitude is None or longitude is None:
+            return []
+
+        radius_km = self.cell_size * KM_PER_DEGREE
+
+        with self._lock:
+            while True:
+                found = self.nearby(latitude, longitude, radius_km, keyword, open_at)
+                if len(found) >= k or radius_km >= MAX_DISTANCE_KM:
+                    return found[:k]
+                radius_km = min(radius_km * 2, MAX_DISTANCE_KM)
+
+    def nearest_many(
+        self,
+        latitudes: list[float],
+        longitudes: list[float],
+        k: int = 1,
+        keyword: str = "",
+        open_at: datetime | None = None,
+        max_bytes: int = DISTANCE_MATRIX_BYTES,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        批次取得多個座標各自最近的 k 間商店
+
+        座標與商店都轉成單位球面上的三維向量，(座標數 x 商店數) 的內積矩陣以一次矩陣乘法算出；
+        內積越大距離越近，因此只需要對每列的前 k 名計算 haversine 距離。
+        座標依 `max_bytes` 分塊處理，記憶體用量與座標數量無關。
+
+        :param latitudes: 緯度列表
+        :param longitudes: 經度列表
+        :param k: 每個座標的商店數量
+        :param keyword: 商店名稱關鍵字（不分大小寫）
+        :param open_at: 只取得此時間營業中的商店
+        :param max_bytes: 每個內積矩陣分塊的記憶體上限
+
+        :return: (商店 ID 陣列, 距離公里陣列)，形狀皆為 (座標數, min(k, 商店數))，依距離排序
+        """
+        lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+        lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+
+        with self._lock:
+            slots = self._filter(np.flatnonzero(self._active), keyword, open_at)
+            store_ids = self._ids[slots]
+            store_lat = self._lat[slots]
+            store_lon = self._lon[slots]
+
+        count = len(lat)
+        k = min(k, len(slots))
+        ids = np.zeros((count, k), dtype=np.int64)
+        distances = np.zeros((count, k), dtype=np.float64)
+
+        if k == 0:
+            return ids, distances
+
+        points = to_unit_vectors(lat, lon)
+        store_points = to_unit_vectors(store_lat, store_lon)
+
+        # 內積矩陣與 argpartition 的索引矩陣各佔一份
+        rows = max(1, max_bytes // (len(slots) * 8 * 2))
+
+        for start in range(0, count, rows):
+            end = min(start + rows, count)
+            dots = points[start:end] @ store_points.T
+
+            if k < len(slots):
+                # 就地取負號，不另外配置一份暫存矩陣
+                np.negative(dots, out=dots)
+                top = np.argpartition(dots, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(k), (end - start, k))
+
+            # 只對候選計算精確距離
+            top_distances = haversine_km(
+                lat[start:end, np.newaxis], lon[start:end, np.newaxis], store_lat[top], store_lon[top]
+            )
+            order = np.argsort(top_distances, axis=1, kind="stable")
+
+            ids[start:end] = store_ids[np.take_along_axis(top, order, axis=1)]
+            distances[start:end] = np.take_along_axis(top_distances, order, axis=1)
+
+        return ids, distances
+
+
+# 全域商店位置索引
+store_locator = StoreLocator(
+    cell_size=float(os.getenv("STORE_LOCATOR_CELL_SIZE", 0.5)),
+    ttl=float(os.getenv("STORE_LOCATOR_TTL", 300)),
+)
@@ -0,0 +1,32 @@
+from .cache import menu_cache
+from .combo import get_combos
+from .dish import get_dishes
+
+__all__ = [
+    "get_menu",
+    "invalidate_menu",
+    "menu_cache",
+]
+
+
+def get_menu():
+    """
+    取得菜單上的所有餐點與套餐（經過快取）
+
+    :return: (餐點列表, 套餐列表)，載入失敗時回傳 None
+    """
+
+    def load():
+        dishes = get_dishes()
+        if dishes is None:
+            return None
+        return dishes, get_combos()
+
+    return menu_cache.get_or_load("menu", load)
+
+
+def invalidate_menu():
+    """
+    使菜單快取失效
+    """
+    menu_cache.invalidate()
@@ -0,0 +1,155 @@
+from datetime import datetime, time
+from zoneinfo import ZoneInfo
+
+from app.models import Store, StoreRow
+
+__all__ = [
+    "WeeklySchedule",
+    "is_open",
+    "get_local_time",
+    "get_open_at_sql",
+]
+
+
+def is_open(weekday_mask, open_minute, close_minute, weekday: int, minute: int):
+    """
+    判斷營業時間是否涵蓋指定的時間點
+
+    只使用位元運算與比較，參數可以是整數，也可以是 NumPy 陣列（逐元素判斷）。
+    `open_minute >= close_minute` 表示營業到隔天（相等時為 24 小時營業），
+    因此前一天開始的營業時段也可能涵蓋今天凌晨。
+
+    :param weekday_mask: 營業日位元遮罩，第 0 位為星期一
+    :param open_minute: 開店時間（當天的第幾分鐘）
+    :param close_minute: 關店時間（當天的第幾分鐘）
+    :param weekday: 查詢時間的星期，0 為星期一
+    :param minute: 查詢時間為當天的第幾分鐘
+
+    :return: 是否營業中
+    """
+    today = ((weekday_mask >> weekday) & 1) == 1
+    yesterday = ((weekday_mask >> ((weekday - 1) % 7)) & 1) == 1
+    overnight = open_minute >= close_minute
+
+    return (today & (minute >= open_minute) & ((minute < close_minute) | overnight)) | (
+        yesterday & overnight & (minute < close_minute)
+    )
+
+
+class WeeklySchedule:
+    """
+    每週營業時間
+
+    以營業日位元遮罩（第 0 位為星期一）加上開、關店的「當天第幾分鐘」表示，
+    與 `store` 資料表的 `weekday_mask`、`open_minute`、`close_minute` 產生欄位相同。
+    """
+
+    __slots__ = ("weekday_mask", "open_minute", "close_minute")
+
+    def __init__(self, weekday_mask: int, open_minute: int, close_minute: int):
+        self.weekday_mask = weekday_mask
+        self.open_minute = open_minute
+        self.close_minute = close_minute
+
+    @classmethod
+    def from_store(cls, store: Store | StoreRow) -> "WeeklySchedule":
+        """
+        由商店資料建立營業時間
+
+        :param store: 商店資料，`weekdays` 為 1（星期一）到 7（星期日）
+
+        :return: 營業時間
+        """
+        weekday_mask = 0
+        for day in store.weekdays:
+            weekday_mask |= 1 << (day - 1)
+
+        return cls(weekday_mask, to_minute(store.open_time), to_minute(store.close_time))
+
+    def is_open_at(self, at: datetime) -> bool:
+        """
+        判斷指定時間是否營業中
+
+        :param at: 時間
+
+        :return: 是否營業中
+        """
+        return bool(is_open(self.weekday_mask, self.open_minute, self.close_minute, at.weekday(), to_minute(at)))
+
+
+def to_minute(value: time | datetime) -> int:
+    """
+    取得時間為當天的第幾分鐘
+
+    :param value: 時間
+
+    :return: 0 到 1439 的分鐘數
+    """
+    return value.hour * 60 + value.minute
+
+
+def get_local_time(at: datetime, timezone: str) -> datetime:
+    """
+    取得指定時間在商店時區的當地時間
+
+    營業時間是商店的當地時間。帶有時區的時間（例如 `datetime.now(timezone.utc)`）
+    會換算成商店時區；不帶時區的時間則視為每間商店各自的當地時間，直接使用。
+
+    :param at: 時間
+    :param timezone: 商店的 IANA 時區名稱，例如 `Asia/Taipei`
+
+    :return: 當地時間
+    """
+    if at.tzinfo is None:
+        return at
+
+    return at.astimezone(ZoneInfo(timezone))
+
+
+def get_open_at_sql(at: datetime, timezones: list[str], alias: str = "s") -> tuple[str, tuple]:
+    """
+    產生篩選「指定時間營業中」商店的 SQL 條件
+
+    條件只比較 `store` 的產生欄位，不需要在 Python 中逐列解析營業時間。
+    帶有時區的時間先在 Python 中換算成各時區的星期與分鐘，當地時間相同的時區共用一組條件，
+    不依賴 MySQL 的時區資料表（`CONVERT_TZ`）。
+
+    :param at: 時間，不帶時區時視為每間商店的當地時間
+    :param timezones: 商店使用的時區列表
+    :param alias: `store` 資料表的別名
+
+    :return: (SQL 條件, 參數)
+    """
+    sql = f"""
+        (
+            ({alias}.weekday_mask >> %s) & 1
+            AND %s >= {alias}.open_minute
+            AND (%s < {alias}.close_minute OR {alias}.open_minute >= {alias}.close_minute)
+        ) OR (
+            ({alias}.weekday_mask >> %s) & 1
+            AND {alias}.open_minute >= {alias}.close_minute
+            AND %s < {alias}.close_minute
+        )
+    """
+
+    if at.tzinfo is None:
+        weekday, minute = at.weekday(), to_minute(at)
+        return sql, (weekday, minute, minute, (weekday - 1) % 7, minute)
+
+    # (星期, 分鐘) -> 時區列表
+    groups: dict[tuple[int, int], list[str]] = {}
+    for timezone in timezones:
+        local = get_local_time(at, timezone)
+        groups.setdefault((local.weekday(), to_minute(local)), []).append(timezone)
+
+    if not groups:
+        return "FALSE", ()
+
+    conditions = []
+    params = []
+    for (weekday, minute), zones in groups.items():
+        placeholders = ", ".join(["%s"] * len(zones))
+        conditions.append(f"({alias}.timezone IN ({placeholders}) AND ({sql}))")
+        params.extend([*zones, weekday, minute, minute, (weekday - 1) % 7, minute])
+
+    return " OR ".join(conditions), tuple(params)
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+
+__all__ = [
+    "ImageStorage",
+    "FileSystemStorage",
+    "get_image_storage",
+]
+
+
+class ImageStorage(ABC):
+    """
+    圖片內容的儲存後端
+
+    `image` 資料表永遠保存圖片的描述資料（名稱、大小、建立時間）；
+    設定了儲存後端時，圖片內容由後端存放，`image.data` 欄位為 NULL。
+    """
+
+    @abstractmethod
+    def write(self, name: str, data: bytes):
+        """
+        寫入圖片內容
+
+        :param name: 圖片名稱
+        :param data: 圖片內容
+        """
+
+    @abstractmethod
+    def read(self, name: str) -> bytes | None:
+        """
+        讀取圖片內容
+
+        :param name: 圖片名稱
+
+        :return: 圖片內容或 None
+        """
+
+    def path(self, name: str) -> str | None:
+        """
+        取得可以直接串流的檔案路徑
+
+        :param name: 圖片名稱
+
+        :return: 檔案路徑，不支援或檔案不存在時回傳 None
+        """
+        return None
+
+    @abstractmethod
+    def delete(self, name: str):
+        """
+        刪除圖片內容
+
+        :param name: 圖片名稱
+        """
+
+
+class FileSystemStorage(ImageStorage):
+    """
+    以內容定址的目錄樹存放圖片內容
+
+    圖片名稱本身由內容雜湊而來，依名稱前綴分層（`ab/cd/abcd....webp`）避免單一目錄檔案過多。
+    寫入時先寫到同目錄的暫存檔再 `os.replace`，讀取者不會看到寫到一半的檔案。
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _path(self, name: str) -> str:
+        name = os.path.basename(name)
+        return os.path.join(self.root, name[:2], name[2:4], name)
+
+    def write(self, name: str, data: bytes):
+        path = self._path(name)
+
+        if os.path.exists(path):
+            return  # 內容相同，不需要重寫
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def read(self, name: str) -> bytes | None:
+        try:
+            with open(self._path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def path(self, name: str) -> str | None:
+        path = self._path(name)
+        return path if os.path.isfile(path) else None
+
+    def delete(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+_storage: ImageStorage | None = None
+_storage_loaded = False
+_storage_lock = threading.Lock()
+
+
+def get_image_storage() -> ImageStorage | None:
+    """
+    取得設定的圖片儲存後端
+
+    `IMAGE_STORAGE=database`（預設）將圖片內容存放在 `image.data` 欄位，回傳 None；
+    `IMAGE_STORAGE=filesystem` 則存放在 `IMAGE_STORAGE_DIR` 目錄下。
+    """
+    global _storage, _storage_loaded
+
+    if not _storage_loaded:
+        with _storage_lock:
+            if not _storage_loaded:
+                backend = os.getenv("IMAGE_STORAGE", "database").lower()
+                if backend == "filesystem":
+                    _storage = FileSystemStorage(os.getenv("IMAGE_STORAGE_DIR", "storage/images"))
+                elif backend != "database":
+                    raise ValueError(f"Unknown image storage backend: {backend}")
+                _storage_loaded = True
+
+    return _storage
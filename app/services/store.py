@@ -1,15 +1,25 @@
-from datetime import time
+from datetime import datetime, time
 
-from app.db import get_db
-from app.models import Employee, Store
+from app.db import get_db, transaction
+from app.models import Employee, EmployeeRow, Store, StoreRow
 
-from .utils import timedelta_to_time
+from .cache import store_timezone_cache
+from .identity import get_identity_map
+from .locator import store_locator
+from .schedule import get_open_at_sql
+from .utils import get_bounding_box
 
 __all__ = [
     "add_store",
     "get_stores",
     "get_stores_nearby",
+    "get_stores_nearby_from_db",
+    "get_stores_nearest",
+    "get_stores_nearest_many",
+    "get_store_locator",
+    "get_store_timezones",
     "get_store_by_id",
+    "get_stores_by_ids",
     "get_store_by_name",
     "update_store_by_id",
     "delete_store_by_id",
@@ -26,8 +36,6 @@ def add_store(data: dict):
 
     :return: 新增的商店資料或 None
     """
-    db = get_db()
-
     if len(data["open_time"]) == 5:
         data["open_time"] = f"{data['open_time']}:00"
     if len(data["close_time"]) == 5:
@@ -41,12 +49,12 @@ def add_store(data: dict):
     store = Store.model_validate(data)
 
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 INSERT INTO store (name, phone, state, city, address, zipcode, latitude, longitude,
-                    weekdays, open_time, close_time)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+                    weekdays, open_time, close_time, timezone)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
                 """,
                 (
                     store.name,
@@ -60,103 +68,246 @@ def add_store(data: dict):
                     ",".join(map(str, store.weekdays)),
                     store.open_time,
                     store.close_time,
+                    store.timezone,
                 ),
             )
-            db.commit()
             store_id = cursor.lastrowid
     except Exception as e:
         print("Error adding store:", e)
-        db.rollback()
         return None
 
-    return get_store_by_id(store_id)
+    store_timezone_cache.invalidate()
 
+    store = get_store_by_id(store_id)
+    if store is not None:
+        store_locator.upsert(StoreRow.from_model(store))
 
-def get_stores(keyword: str = "", state: str = "", city: str = ""):
+    return store
+
+
+def get_stores(keyword: str = "", state: str = "", city: str = "", open_at: datetime | None = None):
     """
     取得所有商店資料
 
+    供列表頁面與商店位置索引使用，回傳輕量的唯讀資料列而不是 pydantic 模型
+
     :param keyword: 搜尋關鍵字
     :param state: 州份名稱
     :param city: 城市名稱
+    :param open_at: 只取得此時間營業中的商店
 
-    :return: 商店資料列表
+    :return: 商店資料列列表
     """
     db = get_db()
 
+    conditions = "s.name LIKE %s AND s.state LIKE %s AND s.city LIKE %s"
+    params = (f"%{keyword}%", f"%{state}%", f"%{city}%")
+
+    if open_at is not None:
+        open_sql, open_params = get_open_at_sql(open_at, get_store_timezones())
+        conditions += f" AND ({open_sql})"
+        params += open_params
+
     try:
         with db.cursor() as cursor:
+            # 員工數量以單一分組聚合一次取得，避免每間商店各查一次
             cursor.execute(
-                """
-                SELECT * FROM store WHERE name LIKE %s AND state LIKE %s AND city LIKE %s;
+                f"""
+                SELECT s.*, COALESCE(ec.employees_count, 0) AS employees_count
+                FROM store s
+                LEFT JOIN (
+                    SELECT store, COUNT(*) AS employees_count FROM employee GROUP BY store
+                ) ec ON ec.store = s.id
+                WHERE {conditions};
                 """,
-                (f"%{keyword}%", f"%{state}%", f"%{city}%"),
+                params,
             )
             rows = cursor.fetchall()
     except Exception as e:
         print("Error fetching stores:", e)
         return []
 
-    stores: list[Store] = []
+    return StoreRow.from_rows(rows)
 
-    for row in rows:
-        row["weekdays"] = list(map(int, row["weekdays"].split(",")))
-        row["open_time"] = timedelta_to_time(row["open_time"])
-        row["close_time"] = timedelta_to_time(row["close_time"])
-        store = Store.model_validate(row)
-        count_employees_in_store(store)
-        stores.append(store)
 
-    return stores
+def get_store_timezones() -> list[str]:
+    """
+    取得商店使用的時區列表，供營業時間的 SQL 條件換算當地時間
 
+    :return: 時區名稱列表
+    """
+
+    def load():
+        db = get_db()
+
+        try:
+            with db.cursor() as cursor:
+                cursor.execute("SELECT DISTINCT timezone FROM store;")
+                rows = cursor.fetchall()
+        except Exception as e:
+            print("Error fetching store timezones:", e)
+            return None
+
+        return [row["timezone"] for row in rows]
+
+    return store_timezone_cache.get_or_load("", load) or []
+
+
+def get_store_locator():
+    """
+    取得記憶體內的商店位置索引，過期時由資料庫重新載入
 
-def get_stores_nearby(latitude: float, longitude: float, radius_km: float = 5.0, keyword: str = ""):
+    :return: 商店位置索引，沒有商店或載入失敗時回傳 None
+    """
+    if store_locator.is_stale():
+        stores = get_stores()
+        if stores:
+            store_locator.load(stores)
+
+    return None if store_locator.is_stale() else store_locator
+
+
+def get_stores_nearby(
+    latitude: float,
+    longitude: float,
+    radius_km: float = 5.0,
+    keyword: str = "",
+    open_at: datetime | None = None,
+):
     """
     根據經緯度取得附近的商店資料
 
+    由記憶體內的商店位置索引查詢，索引無法使用時改查資料庫。
+
+    :param latitude: 緯度
+    :param longitude: 經度
+    :param radius_km: 半徑（公里）
+    :param keyword: 搜尋關鍵字
+    :param open_at: 只取得此時間營業中的商店
+
+    :return: 附近的商店資料列列表，依距離排序，沒有指定經緯度時回傳空列表
+    """
+    if latitude is None or longitude is None:
+        return []
+
+    locator = get_store_locator()
+    if locator is None:
+        return get_stores_nearby_from_db(latitude, longitude, radius_km, keyword, open_at)
+
+    return [store for store, _ in locator.nearby(latitude, longitude, radius_km, keyword, open_at)]
+
+
+def get_stores_nearest(
+    latitude: float,
+    longitude: float,
+    k: int = 1,
+    keyword: str = "",
+    open_at: datetime | None = None,
+):
+    """
+    根據經緯度取得最近的 k 間商店
+
+    :param latitude: 緯度
+    :param longitude: 經度
+    :param k: 商店數量
+    :param keyword: 搜尋關鍵字
+    :param open_at: 只取得此時間營業中的商店
+
+    :return: (商店資料列, 距離公里) 的列表，依距離排序，沒有指定經緯度時回傳空列表
+    """
+    if latitude is None or longitude is None:
+        return []
+
+    locator = get_store_locator()
+    if locator is None:
+        return []
+
+    return locator.nearest(latitude, longitude, k, keyword, open_at)
+
+
+def get_stores_nearest_many(
+    coordinates: list[tuple[float, float]],
+    k: int = 1,
+    keyword: str = "",
+    open_at: datetime | None = None,
+):
+    """
+    批次取得多個座標各自最近的 k 間商店
+
+    :param coordinates: (緯度, 經度) 的列表
+    :param k: 每個座標的商店數量
+    :param keyword: 搜尋關鍵字
+    :param open_at: 只取得此時間營業中的商店
+
+    :return: 每個座標對應一個 (商店 ID, 距離公里) 的列表，依距離排序
+    """
+    locator = get_store_locator()
+    if locator is None or not coordinates:
+        return [[] for _ in coordinates]
+
+    latitudes, longitudes = zip(*coordinates)
+    ids, distances = locator.nearest_many(latitudes, longitudes, k, keyword, open_at)
+
+    return [list(zip(row_ids.tolist(), row_distances.tolist())) for row_ids, row_distances in zip(ids, distances)]
+
+
+def get_stores_nearby_from_db(
+    latitude: float,
+    longitude: float,
+    radius_km: float = 5.0,
+    keyword: str = "",
+    open_at: datetime | None = None,
+):
+    """
+    根據經緯度由資料庫查詢附近的商店資料
+
     :param latitude: 緯度
     :param longitude: 經度
     :param radius_km: 半徑（公里）
     :param keyword: 搜尋關鍵字
+    :param open_at: 只取得此時間營業中的商店
 
-    :return: 附近的商店資料列表
+    :return: 附近的商店資料列列表，沒有指定經緯度時回傳空列表
     """
+    if latitude is None or longitude is None:
+        return []
+
     db = get_db()
-    stores = []
+
+    # 先以經緯度方框透過空間索引篩出候選商店，只有候選商店需要計算球面距離
+    lat_min, lon_min, lat_max, lon_max = get_bounding_box(latitude, longitude, radius_km)
+
+    conditions = "MBRContains(ST_MakeEnvelope(POINT(%s, %s), POINT(%s, %s)), s.location) AND s.name LIKE %s"
+    params = (lon_min, lat_min, lon_max, lat_max, f"%{keyword}%")
+
+    if open_at is not None:
+        open_sql, open_params = get_open_at_sql(open_at, get_store_timezones())
+        conditions += f" AND ({open_sql})"
+        params += open_params
 
     try:
         with db.cursor() as cursor:
-            # 地球半徑約為 6371 公里
+            # 地球半徑約為 6371 公里；POINT 的座標順序為 (經度, 緯度)
             cursor.execute(
-                """
-                SELECT *, (6371 * ACOS(
-                                COS(RADIANS(%s))
-                                * COS(RADIANS(latitude))
-                                * COS(RADIANS(longitude) - RADIANS(%s))
-                                + SIN(RADIANS(%s)) * SIN(RADIANS(latitude))
-                            )) AS distance
-                FROM store
-                HAVING distance <= %s AND name LIKE %s
+                f"""
+                SELECT s.*, COALESCE(ec.employees_count, 0) AS employees_count,
+                    ST_Distance_Sphere(s.location, POINT(%s, %s), 6371000) / 1000 AS distance
+                FROM store s
+                LEFT JOIN (
+                    SELECT store, COUNT(*) AS employees_count FROM employee GROUP BY store
+                ) ec ON ec.store = s.id
+                WHERE {conditions}
+                HAVING distance <= %s
                 ORDER BY distance;
                 """,
-                (latitude, longitude, latitude, radius_km, f"%{keyword}%"),
+                (longitude, latitude, *params, radius_km),
             )
             rows = cursor.fetchall()
     except Exception as e:
         print("Error fetching nearby stores:", e)
         return []
 
-    stores = []
-
-    for row in rows:
-        row["weekdays"] = list(map(int, row["weekdays"].split(",")))
-        row["open_time"] = timedelta_to_time(row["open_time"])
-        row["close_time"] = timedelta_to_time(row["close_time"])
-        store = Store.model_validate(row)
-        count_employees_in_store(store)
-        stores.append(store)
-
-    return stores
+    return StoreRow.from_rows(rows)
 
 
 def get_store_by_id(store_id: int):
@@ -167,31 +318,59 @@ def get_store_by_id(store_id: int):
 
     :return: 商店資料或 None
     """
+    return get_stores_by_ids([store_id]).get(store_id)
+
+
+def get_stores_by_ids(store_ids: list[int]):
+    """
+    根據多個 ID 一次取得商店資訊（含員工數量）
+
+    :param store_ids: 商店 ID 列表
+
+    :return: 商店 ID -> 商店資料 的字典，找不到的 ID 不會出現在字典中
+    """
+    identity = get_identity_map()
+    stores: dict[int, Store] = {}
+
+    for store_id in dict.fromkeys(store_ids):
+        store = identity.get(Store, store_id)
+        if store is not None:
+            stores[store_id] = store
+
+    store_ids = [store_id for store_id in dict.fromkeys(store_ids) if store_id not in stores]
+
+    if not store_ids:
+        return stores
+
     db = get_db()
+    placeholders = ", ".join(["%s"] * len(store_ids))
 
     try:
         with db.cursor() as cursor:
             cursor.execute(
-                """
-                SELECT * FROM store WHERE id = %s;
+                f"""
+                SELECT s.*, COALESCE(ec.employees_count, 0) AS employees_count
+                FROM store s
+                LEFT JOIN (
+                    SELECT store, COUNT(*) AS employees_count FROM employee
+                    WHERE store IN ({placeholders})
+                    GROUP BY store
+                ) ec ON ec.store = s.id
+                WHERE s.id IN ({placeholders});
                 """,
-                (store_id,),
+                (*store_ids, *store_ids),
             )
-            row = cursor.fetchone()
+            rows = cursor.fetchall()
     except Exception as e:
-        print("Error fetching store by id:", e)
-        return None
-
-    if row is None:
-        return None
+        print("Error fetching stores by ids:", e)
+        return stores
 
-    row["weekdays"] = list(map(int, row["weekdays"].split(",")))
-    row["open_time"] = timedelta_to_time(row["open_time"])
-    row["close_time"] = timedelta_to_time(row["close_time"])
-    store = Store.model_validate(row)
-    count_employees_in_store(store)
+    # Store 的 weekdays 由 Python 驗證器解析，整批驗證沒有穩定的加速（見 benchmarks/model_rows.py），逐列建立即可
+    for row in rows:
+        store = Store.from_row(row)
+        stores[store.id] = identity.add(Store, store)
 
-    return store
+    return stores
 
 
 def get_store_by_name(store_name: str):
@@ -202,6 +381,11 @@ def get_store_by_name(store_name: str):
 
     :return: 商店資料或 None
     """
+    identity = get_identity_map()
+    store = identity.get_by_name(Store, store_name)
+    if store is not None:
+        return store
+
     db = get_db()
 
     try:
@@ -220,13 +404,10 @@ def get_store_by_name(store_name: str):
     if row is None:
         return None
 
-    row["weekdays"] = list(map(int, row["weekdays"].split(",")))
-    row["open_time"] = timedelta_to_time(row["open_time"])
-    row["close_time"] = timedelta_to_time(row["close_time"])
-    store = Store.model_validate(row)
+    store = Store.from_row(row)
     count_employees_in_store(store)
 
-    return store
+    return identity.add(Store, store)
 
 
 def update_store_by_id(store_id: int, data: dict):
@@ -238,8 +419,6 @@ def update_store_by_id(store_id: int, data: dict):
 
     :return: 更新後的商店資料或 None
     """
-    db = get_db()
-
     if len(data["open_time"]) == 5:
         data["open_time"] = f"{data['open_time']}:00"
     if len(data["close_time"]) == 5:
@@ -253,7 +432,7 @@ def update_store_by_id(store_id: int, data: dict):
     store = Store.model_validate(data)
 
     # 生成更新語句
-    fields = ["name", "phone", "state", "city", "address", "zipcode", "latitude", "longitude"]
+    fields = ["name", "phone", "state", "city", "address", "zipcode", "latitude", "longitude", "timezone"]
     values = [getattr(store, key) for key in fields]
     fields.extend(["weekdays", "open_time", "close_time"])
     values.extend(
@@ -271,20 +450,25 @@ def update_store_by_id(store_id: int, data: dict):
     print("With values:", values)
 
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 f"""
                 UPDATE store SET {fields} WHERE id = %s;
                 """,
                 tuple(values),
             )
-            db.commit()
     except Exception as e:
         print("Error updating store:", e)
-        db.rollback()
         return None
 
-    return get_store_by_id(store_id)
+    store_timezone_cache.invalidate()
+    get_identity_map().discard(Store, store_id)
+
+    store = get_store_by_id(store_id)
+    if store is not None:
+        store_locator.upsert(StoreRow.from_model(store))
+
+    return store
 
 
 def delete_store_by_id(store_id: int):
@@ -295,22 +479,26 @@ def delete_store_by_id(store_id: int):
 
     :return: 是否刪除成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 DELETE FROM store WHERE id = %s;
                 """,
                 (store_id,),
             )
-            db.commit()
     except Exception as e:
         print("Error deleting store:", e)
-        db.rollback()
         return False
 
+    store_timezone_cache.invalidate()
+
+    # 員工的 store 欄位會被設為 NULL
+    identity = get_identity_map()
+    identity.discard(Store, store_id)
+    identity.clear(Employee)
+    store_locator.remove(store_id)
+
     return True
 
 
@@ -353,7 +541,7 @@ def get_employees_in_store(store: Store):
 
     :param store: 商店對象
 
-    :return: 員工資料列表
+    :return: 員工資料列列表
     """
     db = get_db()
 
@@ -361,7 +549,7 @@ def get_employees_in_store(store: Store):
         with db.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT * FROM employee WHERE store = %s;
+                SELECT *, hireDate AS hire_date, type AS type_ FROM employee WHERE store = %s;
                 """,
                 (store.id,),
             )
@@ -370,12 +558,4 @@ def get_employees_in_store(store: Store):
         print("Error fetching employees in store:", e)
         return []
 
-    employees = []
-
-    for row in rows:
-        row["store"] = store
-        row["hire_date"] = row["hireDate"]
-        row["type_"] = row["type"]
-        employees.append(Employee.model_validate(row))
-
-    return employees
+    return EmployeeRow.from_rows([{**row, "store": store} for row in rows])
@@ -1,8 +1,9 @@
-from app.db import get_db
+from app.db import get_db, transaction
 from app.models import Ingredient, Supplier, SupplierSummary
 
+from .identity import get_identity_map
 from .image import process_image_upload
-from .ingredient import add_ingredient, get_ingredient_by_name
+from .ingredient import get_ingredients_by_names
 
 __all__ = [
     "add_supplier",
@@ -24,8 +25,6 @@ def add_supplier(data: dict):
 
     :return: 新增的供應商資料
     """
-    db = get_db()
-
     # 處理需要關聯的食材列表
     after = data.pop("ingredients", [])
     data = process_image_upload(data)
@@ -34,7 +33,8 @@ def add_supplier(data: dict):
     supplier = Supplier.model_validate(data)
 
     try:
-        with db.cursor() as cursor:
+        # 供應商與所有食材關聯在同一個交易中寫入
+        with transaction() as cursor:
             cursor.execute(
                 """
                 INSERT INTO supplier (name, description, contact_person, email, phone,
@@ -53,18 +53,15 @@ def add_supplier(data: dict):
                     supplier.image_url,
                 ),
             )
-            db.commit()
             supplier_id = cursor.lastrowid
+
+            # 處理食材關聯
+            update_supplier_ingredients(cursor, supplier_id, before=[], after=after)
     except Exception as e:
         print("Error adding supplier:", e)
-        db.rollback()
         return None
 
-    # 處理食材關聯
-    supplier = get_supplier_by_id(supplier_id)
-    update_supplier_ingredients(supplier, before=[], after=after)
-
-    return supplier
+    return get_supplier_by_id(supplier_id)
 
 
 def get_suppliers(keyword: str = ""):
@@ -91,7 +88,7 @@ def get_suppliers(keyword: str = ""):
         print("Error fetching suppliers:", e)
         return []
 
-    suppliers = [SupplierSummary.model_validate(row) for row in rows]
+    suppliers = SupplierSummary.from_rows(rows)
 
     return suppliers
 
@@ -104,6 +101,11 @@ def get_supplier_by_id(supplier_id: int):
 
     :return: 供應商資料或 None
     """
+    identity = get_identity_map()
+    supplier = identity.get(Supplier, supplier_id)
+    if supplier is not None:
+        return supplier
+
     db = get_db()
 
     try:
@@ -122,11 +124,11 @@ def get_supplier_by_id(supplier_id: int):
     if row is None:
         return None
 
-    supplier = Supplier.model_validate(row)
+    supplier = Supplier.from_row(row)
     ingredients = get_ingredients_by_supplier(supplier)
     supplier.ingredients = ingredients
 
-    return supplier
+    return identity.add(Supplier, supplier)
 
 
 def update_supplier_by_id(supplier_id: int, data: dict):
@@ -138,8 +140,6 @@ def update_supplier_by_id(supplier_id: int, data: dict):
 
     :return: 更新後的供應商資料
     """
-    db = get_db()
-
     original_supplier = get_supplier_by_id(supplier_id)
     if original_supplier is None:
         return None
@@ -152,7 +152,8 @@ def update_supplier_by_id(supplier_id: int, data: dict):
     supplier = Supplier.model_validate(data)
 
     try:
-        with db.cursor() as cursor:
+        # 供應商與所有食材關聯在同一個交易中寫入
+        with transaction() as cursor:
             cursor.execute(
                 """
                 UPDATE supplier
@@ -173,17 +174,16 @@ def update_supplier_by_id(supplier_id: int, data: dict):
                     supplier_id,
                 ),
             )
-            db.commit()
+
+            # 處理食材關聯
+            update_supplier_ingredients(cursor, supplier_id, before=before, after=after)
     except Exception as e:
         print("Error updating supplier:", e)
-        db.rollback()
         return None
 
-    # 處理食材關聯
-    supplier = get_supplier_by_id(supplier_id)
-    update_supplier_ingredients(supplier, before=before, after=after)
+    get_identity_map().discard(Supplier, supplier_id)
 
-    return supplier
+    return get_supplier_by_id(supplier_id)
 
 
 def delete_supplier_by_id(supplier_id: int):
@@ -194,22 +194,23 @@ def delete_supplier_by_id(supplier_id: int):
 
     :return: 是否刪除成功
     """
-    db = get_db()
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 DELETE FROM supplier WHERE id = %s;
                 """,
                 (supplier_id,),
             )
-            db.commit()
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
     except Exception as e:
         print("Error deleting supplier:", e)
-        db.rollback()
         return False
 
+    get_identity_map().discard(Supplier, supplier_id)
+
+    return deleted
+
 
 # ====================
 # Supplier Ingredients
@@ -225,10 +226,8 @@ def add_ingredient_to_supplier(supplier: Supplier, ingredient: Ingredient):
 
     :return: 是否新增成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 INSERT INTO supplier_ingredient (supplier_id, ingredient_id)
@@ -236,12 +235,12 @@ def add_ingredient_to_supplier(supplier: Supplier, ingredient: Ingredient):
                 """,
                 (supplier.id, ingredient.id),
             )
-            db.commit()
     except Exception as e:
         print("Error adding ingredient to supplier:", e)
-        db.rollback()
         return False
 
+    get_identity_map().discard(Supplier, supplier.id)
+
     return True
 
 
@@ -254,10 +253,8 @@ def remove_ingredient_from_supplier(supplier: Supplier, ingredient: Ingredient):
 
     :return: 是否移除成功
     """
-    db = get_db()
-
     try:
-        with db.cursor() as cursor:
+        with transaction() as cursor:
             cursor.execute(
                 """
                 DELETE FROM supplier_ingredient
@@ -265,38 +262,58 @@ def remove_ingredient_from_supplier(supplier: Supplier, ingredient: Ingredient):
                 """,
                 (supplier.id, ingredient.id),
             )
-            db.commit()
-            return cursor.rowcount > 0
+            removed = cursor.rowcount > 0
     except Exception as e:
         print("Error removing ingredient from supplier:", e)
-        db.rollback()
         return False
 
+    get_identity_map().discard(Supplier, supplier.id)
 
-def update_supplier_ingredients(supplier: Supplier, before: list[str], after: list[str]):
+    return removed
+
+
+def update_supplier_ingredients(cursor, supplier_id: int, before: list[str], after: list[str]):
     """
     更新供應商的食材列表
 
-    :param supplier: 供應商資料
+    新增與移除的關聯各以單一語句寫入。需在 `transaction()` 中呼叫，
+    發生錯誤時直接拋出例外，由交易整筆 rollback。
+
+    :param cursor: 交易中的 cursor
+    :param supplier_id: 供應商 ID
     :param before: 更新前的食材名稱列表
     :param after: 更新後的食材名稱列表
     """
     before = set(before)
     after = set(after)
-    to_add = after - before
-    to_remove = before - after
+
+    # 一次取得所有食材，要新增的食材若不存在則自動建立
+    added = get_ingredients_by_names(list(after - before))
+    removed = get_ingredients_by_names(list(before - after), create=False)
+
+    to_add = [added[ing_name].id for ing_name in after - before]
+    to_remove = [ing.id for ing in removed.values()]
 
     # 添加新的食材
-    for ing_name in to_add:
-        ing = get_ingredient_by_name(ing_name)
-        if not ing:
-            ing = add_ingredient({"name": ing_name})
-        add_ingredient_to_supplier(supplier, ing)
+    if to_add:
+        cursor.executemany(
+            """
+            INSERT INTO supplier_ingredient (supplier_id, ingredient_id)
+            VALUES (%s, %s);
+            """,
+            [(supplier_id, ingredient_id) for ingredient_id in to_add],
+        )
 
     # 移除不需要的食材
-    for ing_name in to_remove:
-        ing = get_ingredient_by_name(ing_name)
-        remove_ingredient_from_supplier(supplier, ing)
+    if to_remove:
+        placeholders = ", ".join(["%s"] * len(to_remove))
+        cursor.execute(
+            f"""
+            DELETE FROM supplier_ingredient
+            WHERE supplier_id = %s AND ingredient_id IN ({placeholders});
+            """,
+            (supplier_id, *to_remove),
+        )
 
 
 def get_ingredients_by_supplier(supplier: Supplier):
@@ -324,6 +341,6 @@ def get_ingredients_by_supplier(supplier: Supplier):
         print("Error fetching ingredients by supplier:", e)
         return []
 
-    ingredients = [Ingredient.model_validate(row) for row in rows]
+    ingredients = Ingredient.from_rows(rows)
 
     return ingredients
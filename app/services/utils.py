@@ -1,31 +1,91 @@
+import base64
 import io
-from datetime import time, timedelta
-from hashlib import sha1
+import json
+import math
+from hashlib import sha1, sha256
 from uuid import NAMESPACE_DNS, uuid5
 
 from PIL import Image as PILImage
 
 
-def convert_to_webp(image_data: bytes) -> bytes:
+class ImageTooLarge(ValueError):
     """
-    將圖片轉換為 WebP 格式
+    圖片超過允許的位元組或像素上限
+    """
+
+
+def convert_to_webp_variants(
+    image_data: bytes | bytearray,
+    widths: list[int],
+    max_dimension: int | None = None,
+    max_pixels: int | None = None,
+) -> tuple[bytes, dict[int, bytes], int]:
+    """
+    將圖片轉換為 WebP 格式，並產生多個寬度的縮圖
+
+    `PILImage.open` 只讀取檔頭，像素上限在解碼前就會檢查。
+    超過 `max_dimension` 的圖片透過 `thumbnail` 縮小：JPEG 會以 draft 模式直接解碼成
+    1/2、1/4 或 1/8 尺寸，其他格式先以 `reduce` 整數倍縮小，再做高品質縮放，
+    不需要在記憶體中展開完整解析度的點陣圖。
 
     :param image_data: 原始圖片的二進位資料
+    :param widths: 縮圖寬度列表，不小於原圖寬度的會被略過
+    :param max_dimension: 原圖最長邊的上限，None 表示保留原尺寸
+    :param max_pixels: 原始圖片的像素數量上限，None 表示不限制
 
-    :return: 轉換後的 WebP 圖片二進位資料
+    :return: (原尺寸的 WebP 資料, 寬度 -> 縮圖 WebP 資料 的字典, 原圖寬度)
     """
 
     buf = io.BytesIO(image_data)
+    variants: dict[int, bytes] = {}
+
+    try:
+        img = PILImage.open(buf)
+    except PILImage.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+
+    with img:
+        w, h = img.size
+        if max_pixels is not None and w * h > max_pixels:
+            raise ImageTooLarge(f"Image is {w}x{h} pixels, the limit is {max_pixels} pixels.")
+
+        if max_dimension is not None and max(w, h) > max_dimension:
+            img.thumbnail((max_dimension, max_dimension), PILImage.LANCZOS, reducing_gap=3.0)
 
-    with PILImage.open(buf) as img:
         webp_io = io.BytesIO()
         img.save(webp_io, format="WEBP")
         webp_data = webp_io.getvalue()
         webp_io.close()
 
+        w, h = img.size
+
+        for width in sorted(set(widths)):
+            if width >= w:
+                continue
+
+            height = max(1, round(h * width / w))
+            with img.resize((width, height), PILImage.LANCZOS) as resized:
+                webp_io = io.BytesIO()
+                resized.save(webp_io, format="WEBP")
+                variants[width] = webp_io.getvalue()
+                webp_io.close()
+
     buf.close()
 
-    return webp_data
+    return webp_data, variants, w
+
+
+def get_variant_name(name: str, width: int) -> str:
+    """
+    取得圖片縮圖的名稱
+
+    :param name: 原圖名稱，例如 `xxxx.webp`
+    :param width: 縮圖寬度
+
+    :return: 縮圖名稱，例如 `xxxx_w400.webp`
+    """
+    stem, _, ext = name.rpartition(".")
+    return f"{stem}_w{width}.{ext}"
 
 
 def get_uuid_from_data(data: bytes) -> str:
@@ -40,16 +100,102 @@ def get_uuid_from_data(data: bytes) -> str:
     return str(uuid5(NAMESPACE_DNS, hashed))
 
 
-def timedelta_to_time(td: timedelta):
+def new_upload_hasher(settings: str):
+    """
+    建立上傳雜湊的 hasher，可分段 `update` 原始內容
+
+    設定會一起納入雜湊，設定改變後相同的原始檔會得到不同的鍵，不會取回舊設定編碼的圖片。
+
+    :param settings: 編碼設定字串
+
+    :return: 已寫入設定的 SHA-256 hasher
+    """
+    hasher = sha256(settings.encode())
+    hasher.update(b"\0")
+    return hasher
+
+
+def get_upload_key(data: bytes, settings: str) -> str:
     """
-    將 timedelta 轉換為時間格式
+    根據原始上傳內容與編碼設定生成上傳雜湊
+
+    :param data: 原始上傳的二進位資料
+    :param settings: 編碼設定字串
+
+    :return: 64 字元的 SHA-256 十六進位字串
+    """
+    hasher = new_upload_hasher(settings)
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+# 每一緯度約 111.045 公里
+KM_PER_DEGREE = 111.045
+
+
+def get_bounding_box(latitude: float, longitude: float, radius_km: float) -> tuple[float, float, float, float]:
+    """
+    計算包住指定圓形範圍的經緯度方框
+
+    經度方向的寬度依緯度的餘弦放大；方框碰到極點或跨越換日線時，經度改為涵蓋全部範圍。
+
+    :param latitude: 中心緯度
+    :param longitude: 中心經度
+    :param radius_km: 半徑（公里）
+
+    :return: (最小緯度, 最小經度, 最大緯度, 最大經度)
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    lat_min = max(-90.0, latitude - dlat)
+    lat_max = min(90.0, latitude + dlat)
+
+    cos_lat = math.cos(math.radians(max(abs(lat_min), abs(lat_max))))
+    if lat_min <= -90.0 or lat_max >= 90.0 or cos_lat <= 0:
+        return lat_min, -180.0, lat_max, 180.0
+
+    dlon = radius_km / (KM_PER_DEGREE * cos_lat)
+    lon_min = longitude - dlon
+    lon_max = longitude + dlon
+    if lon_min < -180.0 or lon_max > 180.0:
+        return lat_min, -180.0, lat_max, 180.0
+
+    return lat_min, lon_min, lat_max, lon_max
+
+
+def encode_cursor(*values) -> str:
+    """
+    將分頁位置編碼為網址安全的游標字串
+
+    :param values: 排序鍵的值，例如 (名稱, ID)
+
+    :return: 游標字串
+    """
+    data = json.dumps(values, ensure_ascii=False, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, types: tuple[type, ...]) -> tuple:
+    """
+    解碼游標字串
+
+    :param cursor: `encode_cursor` 產生的游標字串
+    :param types: 排序鍵每個值的型別
 
-    :param td: 時間差物件
+    :return: 排序鍵的值
 
-    :return: 時間字串，格式為 HH:MM:SS
+    :raises ValueError: 游標格式錯誤
     """
-    total_seconds = int(td.total_seconds())
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    seconds = total_seconds % 60
-    return time(hour=hours, minute=minutes, second=seconds)
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+    if (
+        not isinstance(values, list)
+        or len(values) != len(types)
+        or not all(type(value) is t for value, t in zip(values, types))
+    ):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+    return tuple(values)
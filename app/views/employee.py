@@ -25,7 +25,7 @@ def employees_list():
     if keyword:
         store = get_store_by_name(keyword)
         if store:
-            employees = get_employees_in_store(store.id)
+            employees = get_employees_in_store(store)
         else:
             employees = []
     else:
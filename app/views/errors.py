@@ -27,6 +27,14 @@ def method_not_allowed(e):
     return render_template("errors/405.html"), 405
 
 
+@error_bp.app_errorhandler(413)
+def request_entity_too_large(e):
+    """
+    這裡渲染的是 413.html 頁面
+    """
+    return render_template("errors/413.html"), 413
+
+
 @error_bp.app_errorhandler(418)
 def im_a_teapot(e):
     """
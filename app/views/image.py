@@ -1,11 +1,25 @@
+from datetime import timezone
 from random import random
 
-from flask import Blueprint, abort
+from flask import Blueprint, Response, abort, jsonify, request, send_file
+from werkzeug.http import http_date
 
-from app.services import delete_image_by_id, get_image_by_name
+from app.services import (
+    delete_image_by_id,
+    get_image_by_name,
+    get_image_encoder_stats,
+    get_image_info_by_name,
+    get_image_path,
+    get_image_variant_name,
+    get_image_variant_widths,
+    get_image_width,
+)
 
 image_bp = Blueprint("image", __name__, url_prefix="/images")
 
+# 一年
+IMAGE_MAX_AGE = 365 * 24 * 60 * 60
+
 
 @image_bp.route("/", methods=["POST"])
 def upload_image():
@@ -15,14 +29,65 @@ def upload_image():
     abort(501)  # Not Implemented
 
 
-@image_bp.route("/<string:name>", methods=["GET"])
+@image_bp.route("/stats")
+def image_stats():
+    """
+    圖片編碼行程池的統計（佇列深度、等待與編碼耗時）
+    """
+    return jsonify(get_image_encoder_stats())
+
+
+@image_bp.route("/<string:name>", methods=["GET", "HEAD"])
 def view_image(name):
-    image = get_image_by_name(name)
+    # ?w= 指定需要的寬度，回傳最接近的縮圖
+    variant = get_image_variant_name(name, request.args.get("w", type=int))
+
+    # 只查詢描述資料，不讀取圖片內容
+    info = get_image_info_by_name(variant)
+
+    if info is None and variant != name:
+        # 快取的縮圖列表過期（縮圖已被刪除）時改用原圖
+        info = get_image_info_by_name(name)
+
+    if info is None:
+        abort(404)
+
+    # 圖片名稱由內容雜湊而來，名稱相同即內容相同，可以永久快取並直接作為強 ETag
+    headers = {
+        "Content-Type": "image/webp",
+        "Cache-Control": f"public, max-age={IMAGE_MAX_AGE}, immutable",
+        "ETag": f'"{info.name}"',
+    }
+    last_modified = info.created_at.replace(tzinfo=timezone.utc) if info.created_at else None
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(info.name)
+    else:
+        not_modified = bool(request.if_modified_since and last_modified and request.if_modified_since >= last_modified)
+
+    if not_modified:
+        return Response(status=304, headers=headers)
+
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(info.size)
+        return Response(status=200, headers=headers)
+
+    path = get_image_path(info.name)
+
+    if path is not None:
+        # 圖片存放在檔案系統，直接串流檔案（啟用 USE_X_SENDFILE 時交給前端伺服器傳送）
+        response = send_file(path, mimetype="image/webp", etag=False, max_age=IMAGE_MAX_AGE)
+        response.headers.update(headers)
+        return response
+
+    image = get_image_by_name(info.name)
 
     if image is None:
         abort(404)
 
-    return image.data, 200, {"Content-Type": "image/webp"}
+    return image.data, 200, headers
 
 
 @image_bp.route("/<string:name>", methods=["DELETE"])
@@ -38,3 +103,25 @@ def delete_image(name):
         abort(500)
 
     return "", 204
+
+
+@image_bp.app_template_filter("srcset")
+def srcset(image_url: str):
+    """
+    為圖片網址產生 `srcset` 屬性值，例如 `/images/x.webp?w=200 200w, /images/x.webp 400w`
+
+    列出實際產生的縮圖與原圖；`srcset` 有寬度描述時瀏覽器會忽略 `src`，
+    因此原圖必須列入，否則較寬的版面無法選到原尺寸。
+    原圖寬度未記錄時回傳空字串，只使用 `src`。
+    """
+    if not image_url or not image_url.startswith(image_bp.url_prefix + "/"):
+        return ""
+
+    name = image_url[len(image_bp.url_prefix) + 1 :]
+    width = get_image_width(name)
+    if not width:
+        return ""
+
+    candidates = [f"{image_url}?w={variant_width} {variant_width}w" for variant_width in get_image_variant_widths(name)]
+    candidates.append(f"{image_url} {width}w")
+    return ", ".join(candidates)
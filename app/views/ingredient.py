@@ -5,7 +5,7 @@
     delete_ingredient_by_id,
     get_dishes_by_ingredient,
     get_ingredient_by_id,
-    get_ingredients,
+    get_ingredients_page,
     get_suppliers_by_ingredient,
 )
 
@@ -18,13 +18,25 @@ def ingredients():
     食材列表頁面
     """
     keyword = request.args.get("query", "")
-    total = count_ingredients(keyword=keyword)
-    page = request.args.get("page", 1, type=int)
-    per_page = 20
-    offset = (page - 1) * per_page
-    ingredients = get_ingredients(keyword=keyword, offset=offset, limit=per_page)
+    after = request.args.get("after", "")
+    before = request.args.get("before", "")
 
-    return render_template("ingredient/list.html", ingredients=ingredients, keyword=keyword, total=total, page=page)
+    try:
+        page = get_ingredients_page(keyword=keyword, after=after, before=before, per_page=20)
+    except ValueError:
+        abort(400, description="Invalid page cursor.")
+
+    # 只有第一頁計算總數（結果會被快取），翻頁時沿用快取中的數量
+    total = count_ingredients(keyword=keyword, cached_only=bool(after or before))
+
+    return render_template(
+        "ingredient/list.html",
+        ingredients=page["ingredients"],
+        keyword=keyword,
+        total=total,
+        next_cursor=page["next"],
+        prev_cursor=page["prev"],
+    )
 
 
 @ingredient_bp.route("/<int:ingredient_id>")
@@ -3,11 +3,12 @@
 from app.db import get_db
 
 location_bp = Blueprint("location", __name__, url_prefix="/location")
-db = get_db()
 
 
 @location_bp.route("/", methods=["GET", "POST"])
 def location():
+    db = get_db()
+
     # 處理新增位置的表單提交
     if request.method == "POST":
         form = request.form
@@ -1,13 +1,24 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, abort, render_template
 
-from app.services import get_combos, get_dishes
+from app.services import get_menu, menu_cache
 
 menu_bp = Blueprint("menu", __name__, url_prefix="/menu")
 
 
 @menu_bp.route("/")
 def menu():
-    dishes = get_dishes()
-    combos = get_combos()
+    def render():
+        data = get_menu()
+        if data is None:
+            return None
 
-    return render_template("menu/list.html", dishes=dishes, combos=combos)
+        dishes, combos = data
+        return render_template("menu/list.html", dishes=dishes, combos=combos)
+
+    # 渲染後的頁面與菜單資料共用同一個版本號，任何餐點或套餐的寫入都會讓它失效
+    page = menu_cache.get_or_load("page", render)
+
+    if page is None:
+        abort(500)
+
+    return page
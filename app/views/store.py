@@ -1,4 +1,7 @@
-from flask import Blueprint, abort, render_template, request, url_for
+import os
+from datetime import datetime, timezone
+
+from flask import Blueprint, abort, jsonify, render_template, request, url_for
 
 from app.services import (
     add_store,
@@ -6,11 +9,19 @@
     get_store_by_id,
     get_stores,
     get_stores_nearby,
+    get_stores_nearest_many,
     update_store_by_id,
 )
 
 store_bp = Blueprint("store", __name__, url_prefix="/stores")
 
+# 批次查詢最近商店時，單次請求的座標數量與 k 的上限
+NEAREST_MAX_COORDINATES = int(os.getenv("STORES_NEAREST_MAX_COORDINATES", 10000))
+NEAREST_MAX_K = 20
+
+# 附近商店查詢的半徑上限（公里）
+NEARBY_MAX_RADIUS_KM = float(os.getenv("STORES_NEARBY_MAX_RADIUS_KM", 1000))
+
 weekdays_map = {
     1: "Monday",
     2: "Tuesday",
@@ -25,10 +36,12 @@
 @store_bp.route("/")
 def stores_list():
     keyword = request.args.get("query", "").strip()
+    open_now = request.args.get("open_now", "").lower() in ("1", "true", "yes")
 
-    stores = get_stores(keyword)
+    # 以 UTC 的當下時間查詢，由各商店的時區換算成當地時間
+    stores = get_stores(keyword, open_at=datetime.now(timezone.utc) if open_now else None)
 
-    return render_template("store/list.html", stores=stores, keyword=keyword)
+    return render_template("store/list.html", stores=stores, keyword=keyword, open_now=open_now)
 
 
 @store_bp.route("/nearby")
@@ -37,10 +50,82 @@ def stores_nearby():
     longitude = request.args.get("longitude", type=float)
     radius = request.args.get("radius", default=10.0, type=float)
     keyword = request.args.get("query", "").strip()
-
-    stores = get_stores_nearby(latitude, longitude, radius_km=radius, keyword=keyword)
-
-    return render_template("store/list-nearby.html", stores=stores, keyword=keyword)
+    open_now = request.args.get("open_now", "").lower() in ("1", "true", "yes")
+
+    # 未指定座標時顯示空列表；NaN 與無限大在比較時都不成立，會一併被拒絕
+    if latitude is not None and not -90 <= latitude <= 90:
+        return abort(400)
+    if longitude is not None and not -180 <= longitude <= 180:
+        return abort(400)
+    if not 0 < radius <= NEARBY_MAX_RADIUS_KM:
+        return abort(400)
+
+    stores = get_stores_nearby(
+        latitude,
+        longitude,
+        radius_km=radius,
+        keyword=keyword,
+        open_at=datetime.now(timezone.utc) if open_now else None,
+    )
+
+    return render_template("store/list-nearby.html", stores=stores, keyword=keyword, open_now=open_now)
+
+
+@store_bp.route("/nearest", methods=["POST"])
+def stores_nearest():
+    """
+    批次查詢最近的商店
+
+    請求內容：`{"coordinates": [[緯度, 經度], ...], "k": 1, "query": "", "open_now": false, "open_at": null}`，
+    `open_at` 為 ISO 格式的時間，指定時只回傳該時間營業中的商店；
+    帶有時區時換算成各商店的當地時間，不帶時區時視為各商店的當地時間
+    回應內容：`{"k": 1, "results": [[{"id": 商店 ID, "distance": 公里}, ...], ...]}`，
+    `results` 的順序與 `coordinates` 相同
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return abort(400)
+
+    coordinates = payload.get("coordinates")
+    k = payload.get("k", 1)
+    keyword = payload.get("query") or ""
+
+    open_at = None
+    if payload.get("open_at"):
+        try:
+            open_at = datetime.fromisoformat(str(payload["open_at"]))
+        except ValueError:
+            return abort(400)
+    elif payload.get("open_now"):
+        open_at = datetime.now(timezone.utc)
+
+    if not isinstance(keyword, str):
+        return abort(400)
+    keyword = keyword.strip()
+
+    if not isinstance(coordinates, list) or len(coordinates) > NEAREST_MAX_COORDINATES:
+        return abort(400)
+    if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= NEAREST_MAX_K:
+        return abort(400)
+
+    try:
+        coordinates = [(float(latitude), float(longitude)) for latitude, longitude in coordinates]
+    except (TypeError, ValueError):
+        return abort(400)
+
+    if not all(-90 <= latitude <= 90 and -180 <= longitude <= 180 for latitude, longitude in coordinates):
+        return abort(400)
+
+    results = get_stores_nearest_many(coordinates, k=k, keyword=keyword, open_at=open_at)
+
+    return jsonify(
+        {
+            "k": k,
+            "results": [
+                [{"id": store_id, "distance": round(distance, 3)} for store_id, distance in row] for row in results
+            ],
+        }
+    )
 
 
 @store_bp.route("/<int:store_id>")
@@ -73,6 +158,7 @@ def add_store_view():
             "weekdays": list(map(int, form.getlist("weekdays"))),
             "open_time": form.get("open_time", ""),
             "close_time": form.get("close_time", ""),
+            "timezone": form.get("timezone", ""),
         }
 
         new_store = add_store(data)
@@ -108,6 +194,7 @@ def edit_store(store_id: int):
             "weekdays": list(map(int, form.getlist("weekdays"))),
             "open_time": form.get("open_time", ""),
             "close_time": form.get("close_time", ""),
+            "timezone": form.get("timezone", ""),
         }
 
         print(data)
@@ -0,0 +1,126 @@
+"""
+比較員工列表使用 pydantic 模型與唯讀資料列時的記憶體用量
+
+    python -m benchmarks.listing_memory [列數]
+
+每種方式都在獨立的子行程中執行，避免前一次配置的記憶體被重複利用而影響結果。
+子行程先建立查詢結果的資料列並量測 RSS，再轉換成列表物件後再次量測，
+兩者的差即為列表物件本身額外佔用的記憶體（欄位值與查詢結果共用的部分不重複計算）。
+不需要連線資料庫。
+"""
+
+import gc
+import os
+import resource
+import subprocess
+import sys
+from datetime import date, datetime, time
+
+from app.models import Employee, EmployeeRow, Store
+
+NOW = datetime(2025, 1, 1, 12, 0, 0)
+
+KINDS = {
+    "pydantic": Employee,
+    "slots": EmployeeRow,
+}
+
+
+def get_rss() -> int:
+    """
+    取得目前行程的 RSS 位元組數
+
+    Linux 讀取 `/proc/self/statm`；其他平台退回使用 `ru_maxrss`（峰值）。
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+def make_rows(count: int) -> list[dict]:
+    """
+    產生與 `get_employees()` 查詢結果相同型別的員工資料列
+
+    員工分配在 10 間商店，與 `load_stores` 一樣共用同一個 Store 物件。
+    """
+    stores = [
+        Store(
+            id=i,
+            name=f"Store {i}",
+            phone="505-555-0199",
+            latitude=35.0844,
+            longitude=-106.6504,
+            state="NM",
+            city="Albuquerque",
+            address="12000 Coors Rd SW",
+            zipcode="87121",
+            weekdays=[1, 2, 3, 4, 5, 6, 7],
+            open_time=time(9, 0),
+            close_time=time(21, 0),
+        )
+        for i in range(10)
+    ]
+
+    return [
+        {
+            "id": i,
+            "name": f"Employee {i}",
+            "position": "Cook",
+            "salary": 30000 + i % 1000,
+            "email": f"employee{i}@lospolloshermanos.com",
+            "phone": f"505-555-{i % 10000:04d}",
+            "hire_date": date(2008, 1, 1 + i % 28),
+            "type_": "Full-time",
+            "store": stores[i % 10],
+            "created_at": NOW,
+            "updated_at": NOW,
+        }
+        for i in range(count)
+    ]
+
+
+def measure(kind: str, count: int):
+    """
+    在子行程中建立列表並輸出佔用的位元組數
+    """
+    model = KINDS[kind]
+
+    rows = make_rows(count)
+    gc.collect()
+    baseline = get_rss()
+
+    employees = model.from_rows(rows)
+    gc.collect()
+
+    print(get_rss() - baseline, len(employees))
+
+
+def main(count: int = 100_000):
+    print(f"{count} employee rows, RSS added by building the listing")
+    print(f"{'kind':<12}{'RSS MiB':>10}{'bytes/row':>12}")
+
+    results = {}
+
+    for kind in KINDS:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.listing_memory", "--child", kind, str(count)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+        rss = int(output[0])
+        results[kind] = rss
+
+        print(f"{kind:<12}{rss / 2**20:>10.1f}{rss / count:>12.0f}")
+
+    print(f"slots uses {results['pydantic'] / results['slots']:.2f}x less memory")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        measure(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
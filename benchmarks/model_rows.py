@@ -0,0 +1,102 @@
+"""
+比較由資料庫資料列建立模型的方式
+
+    python -m benchmarks.model_rows [列數]
+
+資料列的型別與 `app.db.CONVERSIONS` 轉換後的查詢結果相同，不需要連線資料庫。
+每種方式重複執行數次，取最快的一次，並換算成每 10k 列的毫秒數。
+
+`model_construct` 雖然略過驗證，但欄位處理在 Python 中逐一進行，
+比在 pydantic-core 中驗證還慢，因此資料庫資料列仍然經過驗證。
+Store 的 weekdays 由 Python 驗證器解析，`from_rows` 與逐列驗證的差距在量測誤差內，
+因此 Store 的讀取維持逐列的 `from_row`。
+"""
+
+import sys
+import time
+from datetime import date, datetime
+from datetime import time as dt_time
+
+from app.models import Dish, Employee, Ingredient, Store
+
+NOW = datetime(2025, 1, 1, 12, 0, 0)
+
+ROWS = {
+    Employee: {
+        "name": "Walter White",
+        "position": "Cook",
+        "salary": 50000,
+        "email": "walter@lospolloshermanos.com",
+        "phone": "505-555-0100",
+        "hire_date": date(2008, 1, 20),
+        "type_": "Full-time",
+        "store": None,
+        "created_at": NOW,
+        "updated_at": NOW,
+    },
+    Ingredient: {
+        "name": "Chicken",
+        "created_at": NOW,
+        "updated_at": NOW,
+    },
+    Store: {
+        "name": "Albuquerque",
+        "phone": "505-555-0199",
+        "latitude": 35.0844,
+        "longitude": -106.6504,
+        "state": "NM",
+        "city": "Albuquerque",
+        "address": "12000 Coors Rd SW",
+        "zipcode": "87121",
+        "weekdays": "1,2,3,4,5,6,7",
+        "open_time": dt_time(9, 0),
+        "close_time": dt_time(21, 0),
+        "employees_count": 12,
+        "created_at": NOW,
+        "updated_at": NOW,
+    },
+    Dish: {
+        "name": "Fried Chicken",
+        "description": "Crispy fried chicken.",
+        "calories": 650.0,
+        "price": 9.99,
+        "image_url": "/images/chicken.webp",
+        "created_at": NOW,
+        "updated_at": NOW,
+    },
+}
+
+
+def best_of(func, repeat: int = 7) -> float:
+    """
+    重複執行並回傳最短的秒數
+    """
+    best = float("inf")
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+
+    return best
+
+
+def main(count: int = 10_000):
+    scale = 10_000 / count
+
+    print(f"{count} rows per model, ms per 10k rows (best of 7)")
+    print(f"{'model':<12}{'model_validate':>16}{'construct':>12}{'from_rows':>12}{'speedup':>10}")
+
+    for model, row in ROWS.items():
+        rows = [{**row, "id": i} for i in range(count)]
+        model.from_rows(rows[:1])  # 預先編譯 TypeAdapter
+
+        per_row = best_of(lambda: [model.model_validate(r) for r in rows]) * 1000 * scale
+        constructed = best_of(lambda: [model.model_construct(**r) for r in rows]) * 1000 * scale
+        batched = best_of(lambda: model.from_rows(rows)) * 1000 * scale
+
+        print(f"{model.__name__:<12}{per_row:>16.1f}{constructed:>12.1f}{batched:>12.1f}{per_row / batched:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
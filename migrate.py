@@ -1,5 +1,5 @@
 import json
-import os
+import sys
 from collections import defaultdict
 
 from dotenv import load_dotenv
@@ -7,7 +7,15 @@
 load_dotenv()
 
 from app.db import create_tables, drop_all_tables
-from app.services import add_combo, add_dish, add_employee, add_image, add_store, add_supplier
+from app.services import (
+    add_combo,
+    add_dish,
+    add_employee,
+    add_store,
+    add_supplier,
+    import_images,
+    move_images_to_storage,
+)
 
 mappings = defaultdict(dict)
 
@@ -18,20 +26,23 @@ def seed_images():
     """
     print("Seeding images...")
 
-    images = os.listdir("seeds/images")
-
-    print(f"Loaded {len(images)} image files.")
-    for file in images:
-        if file == ".DS_Store":
-            continue  # Skip system file
-        with open(os.path.join("seeds/images", file), "rb") as f:
-            img_data = f.read()
-            img = add_image(img_data)
-            mappings["img"][file] = img.name
+    mappings["img"].update(import_images("seeds/images"))
 
     print("Done.")
 
 
+def get_image_url(image: str) -> str:
+    """
+    取得種子圖片匯入後的網址，圖片沒有成功匯入時停止 migration
+    """
+    name = mappings["img"].get(image)
+
+    if name is None:
+        sys.exit(f"Image {image} was not imported (see the errors above), fix it and run the migration again.")
+
+    return "/images/" + name
+
+
 def seed_stores():
     """
     初始化商店種子資料
@@ -81,7 +92,7 @@ def seed_suppliers():
     print(f"Loaded {len(suppliers_data)} suppliers from JSON.")
 
     for supplier_data in suppliers_data:
-        supplier_data["image_url"] = "/images/" + mappings["img"].get(supplier_data["image"])
+        supplier_data["image_url"] = get_image_url(supplier_data["image"])
         del supplier_data["image"]
         supplier = add_supplier(supplier_data)
         mappings["sup"][supplier.name] = supplier
@@ -101,7 +112,7 @@ def seed_dishes():
     print(f"Loaded {len(dishes_data)} dishes from JSON.")
 
     for dish_data in dishes_data:
-        dish_data["image_url"] = "/images/" + mappings["img"].get(dish_data["image"])
+        dish_data["image_url"] = get_image_url(dish_data["image"])
         del dish_data["image"]
         dish = add_dish(dish_data)
         mappings["dish"][dish.name] = dish
@@ -121,7 +132,7 @@ def seed_combos():
     print(f"Loaded {len(combos_data)} combos from JSON.")
 
     for combo_data in combos_data:
-        combo_data["image_url"] = "/images/" + mappings["img"].get(combo_data["image"])
+        combo_data["image_url"] = get_image_url(combo_data["image"])
         del combo_data["image"]
         combo = add_combo(combo_data)
         mappings["combo"][combo.name] = combo
@@ -129,7 +140,38 @@ def seed_combos():
     print("Done.")
 
 
+def import_images_from(directory: str):
+    """
+    批次匯入目錄中的圖片
+    """
+    print(f"Importing images from {directory}...")
+
+    imported = import_images(directory)
+
+    print(f"Done. {len(imported)} files imported.")
+
+
+def move_images():
+    """
+    將資料庫中的圖片內容搬移到檔案系統（需設定 IMAGE_STORAGE=filesystem）
+    """
+    print("Moving images out of the database...")
+
+    moved = move_images_to_storage()
+
+    print(f"Done. Moved {moved} images.")
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "move-images":
+        move_images()
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "import-images":
+        # python migrate.py import-images <目錄>
+        import_images_from(sys.argv[2] if len(sys.argv) > 2 else "seeds/images")
+        sys.exit(0)
+
     drop_all_tables()  # 先刪除所有表格
     create_tables()  # 再重新建立所有表格
 